@@ -179,6 +179,11 @@ class DBUniqueAd(Base):
     base_ad = relationship("DBAd", foreign_keys=[base_ad_id], back_populates="base_unique_ads")
     original_ads = relationship("DBAd", foreign_keys="DBAd.unique_ad_id", back_populates="unique_ad")
 
+    # Составной индекс для предварительного отбора кандидатов при дедупликации
+    __table_args__ = (
+        Index('ix_unique_ads_location_rooms_price', 'location_id', 'rooms', 'price'),
+    )
+
     def __repr__(self):
         return f"<UniqueAd(id={self.id}, title='{self.title}', price={self.price})>"
 
@@ -0,0 +1,38 @@
+"""Add composite index for duplicate candidate prefiltering
+
+Revision ID: add_unique_ads_candidate_index
+Revises: fix_clip_embedding_indexes
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_unique_ads_candidate_index'
+down_revision = 'fix_clip_embedding_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    """Index (location_id, rooms, price) used by DuplicateProcessor candidate query"""
+    
+    # CONCURRENTLY нельзя выполнять внутри транзакции миграции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_unique_ads_location_rooms_price',
+            'unique_ads',
+            ['location_id', 'rooms', 'price'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+def downgrade():
+    """Drop candidate prefilter index"""
+    
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_unique_ads_location_rooms_price',
+            table_name='unique_ads',
+            postgresql_concurrently=True
+        )
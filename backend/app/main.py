@@ -658,15 +658,14 @@ async def get_ad_duplicates(ad_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 # === ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ ДЛЯ НОРМАЛИЗАЦИИ ТИПА СДЕЛКИ ===
+_LISTING_TYPE_MAP = {k: "продажа" for k in ("продажа", "продаётся", "продается", "sell", "sale")}
+_LISTING_TYPE_MAP.update({k: "аренда" for k in ("аренда", "сдача", "сдается", "сдаётся", "rent", "lease")})
+
 def normalize_listing_type(listing_type: str) -> str:
     if not listing_type:
         return None
     value = listing_type.strip().lower()
-    if value in ["продажа", "продаётся", "продается", "sell", "sale"]:
-        return "продажа"
-    if value in ["аренда", "сдача", "сдается", "сдаётся", "rent", "lease"]:
-        return "аренда"
-    return value  # fallback: сохранить как есть, но в нижнем регистре
+    return _LISTING_TYPE_MAP.get(value, value)  # fallback: сохранить как есть, но в нижнем регистре
 
 @api_router.post("/ads", response_model=Ad, status_code=status.HTTP_200_OK)
 async def create_ad(
@@ -1220,13 +1219,16 @@ async def reindex_elasticsearch_async():
         db = SessionLocal()
         
         try:
-            unique_ads = db.query(db_models.DBUniqueAd).all()
-            ads_data = []
-            for unique_ad in unique_ads:
-                ad_dict = to_elasticsearch_dict(transform_unique_ad(unique_ad))
-                ads_data.append(ad_dict)
+            # Стримим объявления порциями через серверный курсор, не держа всю таблицу в памяти;
+            # связи для transform_unique_ad подгружаются одним запросом на порцию
+            unique_ads = db.query(db_models.DBUniqueAd).options(
+                selectinload(db_models.DBUniqueAd.photos),
+                selectinload(db_models.DBUniqueAd.location),
+                selectinload(db_models.DBUniqueAd.realtor)
+            ).order_by(db_models.DBUniqueAd.id).yield_per(1000)
+            ads_data = (to_elasticsearch_dict(transform_unique_ad(unique_ad)) for unique_ad in unique_ads)
             
-            logger.info(f"Starting reindex of {len(ads_data)} ads")
+            logger.info("Starting reindex of unique ads")
             success = es_service.reindex_all(ads_data)
             
             if success:
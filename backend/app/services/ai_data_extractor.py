@@ -6,6 +6,7 @@ import numpy as np
 from datetime import datetime
 from collections import defaultdict
 import json
+import os
 
 # Основные импорты для E5-Large
 from sentence_transformers import SentenceTransformer  
@@ -1384,6 +1385,27 @@ class AmenitiesExtractor:
 _gliner_model = None
 _e5_model = None
 _extractor_instance = None
+_ai_extractor_instance = None
+_inference_device = None
+
+def get_inference_device() -> str:
+    """Устройство для инференса моделей: AI_DEVICE из окружения, иначе cuda/mps при наличии, иначе cpu"""
+    global _inference_device
+    if _inference_device is None:
+        _inference_device = os.getenv("AI_DEVICE")
+        if not _inference_device:
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    _inference_device = "cuda"
+                elif getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+                    _inference_device = "mps"
+                else:
+                    _inference_device = "cpu"
+            except ImportError:
+                _inference_device = "cpu"
+        logger.info(f"Inference device: {_inference_device}")
+    return _inference_device
 
 def get_cached_gliner_model():
     """Возвращает кэшированную модель GLiNER"""
@@ -1392,7 +1414,7 @@ def get_cached_gliner_model():
         try:
             logger.info("Loading GLiNER model for detailed data extraction...")
             from gliner import GLiNER
-            _gliner_model = GLiNER.from_pretrained("urchade/gliner_medium-v2.1")
+            _gliner_model = GLiNER.from_pretrained("urchade/gliner_medium-v2.1").to(get_inference_device())
             logger.info("✅ GLiNER model loaded successfully")
         except Exception as e:
             logger.warning(f"GLiNER not available: {e}")
@@ -1406,7 +1428,7 @@ def get_cached_e5_model():
         try:
             logger.info("Loading E5-Large model for property type classification...")
             from sentence_transformers import SentenceTransformer
-            _e5_model = SentenceTransformer('intfloat/multilingual-e5-large')
+            _e5_model = SentenceTransformer('intfloat/multilingual-e5-large', device=get_inference_device())
             logger.info("✅ E5-Large model loaded successfully")
         except Exception as e:
             logger.warning(f"E5-Large not available: {e}")
@@ -1895,4 +1917,12 @@ class AIDataExtractor(RealEstateDataExtractor):
     def extract_and_classify(self, title: str, description: str, existing_data: Dict) -> Dict:
         """Метод для обратной совместимости"""
         # Передаем existing_data как item_data для доступа к данным из конфигов
-        return self.extract_comprehensive_data(f"{title} {description}".strip(), item_data=existing_data) 
\ No newline at end of file
+        return self.extract_comprehensive_data(f"{title} {description}".strip(), item_data=existing_data) 
+
+
+def get_cached_ai_extractor():
+    """Возвращает кэшированный экземпляр AIDataExtractor (интерфейс пайплайна скрапера)"""
+    global _ai_extractor_instance
+    if _ai_extractor_instance is None:
+        _ai_extractor_instance = AIDataExtractor()
+    return _ai_extractor_instance
@@ -2,7 +2,7 @@ import asyncio
 import logging
 import os
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
 import aiohttp
 from enum import Enum
@@ -171,7 +171,12 @@ class AutomationService:
     async def start_service(self):
         """Запуск сервиса автоматизации"""
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            # Все запросы идут в свой же API: держим keep-alive соединения и кэш DNS,
+            # а таймауты ограничивают зависание опроса статусов
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, limit_per_host=32, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=30, sock_connect=2),
+            )
         
         if not self._background_task:
             self._background_task = asyncio.create_task(self._background_scheduler())
@@ -372,35 +377,43 @@ class AutomationService:
         progress["new_ads"] = 0
         progress["processed_ads"] = 0
         
-        job_ids = []
-        
-        for source in self.scraping_sources:
-            try:
-                async with self.session.post(f"{self.api_base_url}/api/scraping/start/{source}") as response:
-                    if response.status in [200, 201, 202]:
-                        data = await response.json()
-                        job_id = data.get('job_id')
-                        if job_id:
-                            job_ids.append((source, job_id))
-                            progress["sources_active"] += 1
-                            logger.info(f"Парсинг {source} запущен (job_id: {job_id})")
-                            # Убираем дублирующее уведомление - ScrapyManager уже отправляет событие
-                    else:
-                        progress["failed"] += 1
-                        error_text = await response.text()
-                        logger.error(f"Ошибка запуска парсинга {source}: {response.status} - {error_text}")
-            except Exception as e:
-                progress["failed"] += 1
-                logger.error(f"Ошибка запроса парсинга {source}: {e}")
+        # Запросы на запуск независимы - отправляем их одновременно
+        results = await asyncio.gather(
+            *(self._start_scraping_source(source) for source in self.scraping_sources)
+        )
+        job_ids = [(source, job_id) for source, job_id in results if job_id]
         
         if not job_ids:
             return False
         return await self._wait_for_scraping_completion(job_ids)
     
+    async def _start_scraping_source(self, source: str) -> Tuple[str, Optional[str]]:
+        """Запуск парсинга одного источника, возвращает (source, job_id или None)"""
+        progress = self.stage_details[PipelineStage.SCRAPING]["progress"]
+        try:
+            async with self.session.post(f"{self.api_base_url}/api/scraping/start/{source}") as response:
+                if response.status in [200, 201, 202]:
+                    data = await response.json()
+                    job_id = data.get('job_id')
+                    if job_id:
+                        progress["sources_active"] += 1
+                        logger.info(f"Парсинг {source} запущен (job_id: {job_id})")
+                        # Убираем дублирующее уведомление - ScrapyManager уже отправляет событие
+                    return source, job_id
+                else:
+                    progress["failed"] += 1
+                    error_text = await response.text()
+                    logger.error(f"Ошибка запуска парсинга {source}: {response.status} - {error_text}")
+        except Exception as e:
+            progress["failed"] += 1
+            logger.error(f"Ошибка запроса парсинга {source}: {e}")
+        return source, None
+    
     async def _wait_for_scraping_completion(self, job_ids: list) -> bool:
         """Ожидание завершения парсинга"""
         progress = self.stage_details[PipelineStage.SCRAPING]["progress"]
         completed_jobs = set()
+        poll_delay = 1  # Экспоненциальный backoff: короткие задачи замечаем сразу, длинные - не чаще раза в 30 с
         
         while len(completed_jobs) < len(job_ids):
             await self._update_stats()
@@ -438,7 +451,8 @@ class AutomationService:
                     logger.error(f"Ошибка проверки статуса {source}: {e}")
             
             if len(completed_jobs) < len(job_ids):
-                await asyncio.sleep(30)
+                await asyncio.sleep(poll_delay)
+                poll_delay = min(poll_delay * 2, 30)
         await self._update_stats()
         return progress["failed"] == 0
     
@@ -481,7 +495,8 @@ class AutomationService:
         """Ожидание завершения валидации ссылок"""
         progress = self.stage_details[PipelineStage.LINK_VALIDATION]["progress"]
         max_wait_time = 3600  # 1 час
-        check_interval = 30  # 30 секунд
+        check_interval = 30  # Максимальный интервал опроса, 30 секунд
+        poll_delay = 1  # Экспоненциальный backoff: 1, 2, 4, ... до check_interval
         elapsed_time = 0
         
         while elapsed_time < max_wait_time:
@@ -511,8 +526,9 @@ class AutomationService:
             except Exception as e:
                 logger.error(f"Ошибка проверки статуса валидации ссылок: {e}")
             
-            await asyncio.sleep(check_interval)
-            elapsed_time += check_interval
+            await asyncio.sleep(poll_delay)
+            elapsed_time += poll_delay
+            poll_delay = min(poll_delay * 2, check_interval)
         
         logger.warning("Превышено время ожидания для валидации ссылок")
         return False
@@ -520,7 +536,8 @@ class AutomationService:
     async def _wait_for_process_completion(self, process_type: str) -> bool:
         """Ожидание завершения фоновых процессов"""
         max_wait_time = 3600  
-        check_interval = 30  
+        check_interval = 30  # Максимальный интервал опроса
+        poll_delay = 1  # Экспоненциальный backoff: 1, 2, 4, ... до check_interval
         elapsed_time = 0
         
         while elapsed_time < max_wait_time:
@@ -597,8 +614,9 @@ class AutomationService:
             except Exception as e:
                 logger.error(f"Ошибка проверки статуса {process_type}: {e}")
             
-            await asyncio.sleep(check_interval)
-            elapsed_time += check_interval
+            await asyncio.sleep(poll_delay)
+            elapsed_time += poll_delay
+            poll_delay = min(poll_delay * 2, check_interval)
         
         logger.warning(f"Превышено время ожидания для {process_type}")
         return False
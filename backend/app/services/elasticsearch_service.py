@@ -2,7 +2,7 @@ from elasticsearch import Elasticsearch, NotFoundError
 from elasticsearch_dsl import Document, Text, Integer, Float, Date, Boolean, GeoPoint, Keyword, Completion
 from elasticsearch_dsl import analyzer, tokenizer
 from elasticsearch_dsl import Search, Q
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable
 import logging
 from datetime import datetime
 import asyncio
@@ -173,12 +173,13 @@ class ElasticsearchService:
             logger.error(f"Elasticsearch health check failed: {e}")
             return {'status': 'error', 'error': str(e)}
     
-    def create_index(self) -> bool:
-        """Создание индекса с маппингом"""
+    def create_index(self, index_name: str = None) -> bool:
+        """Создание индекса с маппингом (по умолчанию - self.index_name)"""
+        index_name = index_name or self.index_name
         try:
-            if not self.client.indices.exists(index=self.index_name):
+            if not self.client.indices.exists(index=index_name):
                 self.client.indices.create(
-                    index=self.index_name,
+                    index=index_name,
                     body={
                         'settings': {
                             'number_of_shards': 1,
@@ -302,75 +303,79 @@ class ElasticsearchService:
                         }
                     }
                 )
-                logger.info(f"Index {self.index_name} created successfully")
+                logger.info(f"Index {index_name} created successfully")
             else:
-                logger.info(f"Index {self.index_name} already exists")
+                logger.info(f"Index {index_name} already exists")
             return True
         except Exception as e:
             logger.error(f"Error creating index: {e}")
             return False
     
+    @staticmethod
+    def _build_document(ad_data: Dict) -> Dict:
+        """Документ индекса из словаря объявления (None-поля не включаются)"""
+        search_text_parts = []
+        if ad_data.get('title'):
+            search_text_parts.append(ad_data['title'])
+        if ad_data.get('description'):
+            search_text_parts.append(ad_data['description'])
+        location_data = ad_data.get('location')
+        if location_data and location_data.get('address'):
+            search_text_parts.append(location_data['address'])
+        
+        if ad_data.get('series'):
+            search_text_parts.append(ad_data['series'])
+        if ad_data.get('building_type'):
+            search_text_parts.append(ad_data['building_type'])
+        doc_data = {
+            'title': ad_data.get('title', ''),
+            'description': ad_data.get('description', ''),
+            'source_name': ad_data.get('source_name', ''),
+            'source_url': ad_data.get('source_url', ''),
+            'source_id': ad_data.get('source_id', ''),
+            'price': ad_data.get('price'),
+            'price_original': ad_data.get('price_original', ''),
+            'currency': ad_data.get('currency', 'USD'),
+            'rooms': ad_data.get('rooms'),
+            'area_sqm': ad_data.get('area_sqm'),
+            'land_area_sotka': ad_data.get('land_area_sotka'),
+            'floor': ad_data.get('floor'),
+            'total_floors': ad_data.get('total_floors'),
+            'series': ad_data.get('series', ''),
+            'building_type': ad_data.get('building_type', ''),
+            'condition': ad_data.get('condition', ''),
+            'furniture': ad_data.get('furniture', ''),
+            'heating': ad_data.get('heating', ''),
+            'hot_water': ad_data.get('hot_water', ''),
+            'gas': ad_data.get('gas', ''),
+            'ceiling_height': ad_data.get('ceiling_height'),
+            'city': location_data.get('city', '') if location_data else '',
+            'district': location_data.get('district', '') if location_data else '',
+            'address': location_data.get('address', '') if location_data else '',
+            
+            'duplicates_count': ad_data.get('duplicates_count', 0),
+            'published_at': ad_data.get('published_at'),
+            'created_at': ad_data.get('created_at'),
+            'phone_numbers': ad_data.get('phone_numbers', []),
+            'photo_urls': [str(photo['url']) for photo in ad_data.get('photos', []) if photo and 'url' in photo],
+            'search_text': ' '.join(search_text_parts)
+        }
+        if location_data and location_data.get('lat') is not None and location_data.get('lon') is not None:
+            doc_data['location'] = {
+                'lat': location_data['lat'],
+                'lon': location_data['lon']
+            }
+        else:
+            doc_data['location'] = None
+        return {k: v for k, v in doc_data.items() if v is not None}
+
     def index_ad(self, ad_data: Dict) -> bool:
         """Индексация объявления"""
         try:
-            search_text_parts = []
-            if ad_data.get('title'):
-                search_text_parts.append(ad_data['title'])
-            if ad_data.get('description'):
-                search_text_parts.append(ad_data['description'])
-            location_data = ad_data.get('location')
-            if location_data and location_data.get('address'):
-                search_text_parts.append(location_data['address'])
-            
-            if ad_data.get('series'):
-                search_text_parts.append(ad_data['series'])
-            if ad_data.get('building_type'):
-                search_text_parts.append(ad_data['building_type'])
-            doc_data = {
-                'title': ad_data.get('title', ''),
-                'description': ad_data.get('description', ''),
-                'source_name': ad_data.get('source_name', ''),
-                'source_url': ad_data.get('source_url', ''),
-                'source_id': ad_data.get('source_id', ''),
-                'price': ad_data.get('price'),
-                'price_original': ad_data.get('price_original', ''),
-                'currency': ad_data.get('currency', 'USD'),
-                'rooms': ad_data.get('rooms'),
-                'area_sqm': ad_data.get('area_sqm'),
-                'land_area_sotka': ad_data.get('land_area_sotka'),
-                'floor': ad_data.get('floor'),
-                'total_floors': ad_data.get('total_floors'),
-                'series': ad_data.get('series', ''),
-                'building_type': ad_data.get('building_type', ''),
-                'condition': ad_data.get('condition', ''),
-                'furniture': ad_data.get('furniture', ''),
-                'heating': ad_data.get('heating', ''),
-                'hot_water': ad_data.get('hot_water', ''),
-                'gas': ad_data.get('gas', ''),
-                'ceiling_height': ad_data.get('ceiling_height'),
-                'city': location_data.get('city', '') if location_data else '',
-                'district': location_data.get('district', '') if location_data else '',
-                'address': location_data.get('address', '') if location_data else '',
-                
-                'duplicates_count': ad_data.get('duplicates_count', 0),
-                'published_at': ad_data.get('published_at'),
-                'created_at': ad_data.get('created_at'),
-                'phone_numbers': ad_data.get('phone_numbers', []),
-                'photo_urls': [str(photo['url']) for photo in ad_data.get('photos', []) if photo and 'url' in photo],
-                'search_text': ' '.join(search_text_parts)
-            }
-            if location_data and location_data.get('lat') is not None and location_data.get('lon') is not None:
-                doc_data['location'] = {
-                    'lat': location_data['lat'],
-                    'lon': location_data['lon']
-                }
-            else:
-                doc_data['location'] = None
-            doc_data_cleaned = {k: v for k, v in doc_data.items() if v is not None}
             self.client.index(
                 index=self.index_name,
                 id=ad_data['id'],
-                document=doc_data_cleaned
+                document=self._build_document(ad_data)
             )
             logger.info(f"Ad {ad_data['id']} indexed successfully")
             return True
@@ -378,24 +383,73 @@ class ElasticsearchService:
             logger.error(f"Error indexing ad {ad_data.get('id', 'N/A')}: {e}")
             return False
 
-    def reindex_all(self, ads_data: List[Dict]) -> bool:
-        """Переиндексация всех объявлений"""
+    def reindex_all(self, ads_data: Iterable[Dict], chunk_size: int = 500) -> bool:
+        """
+        Переиндексация всех объявлений (ads_data может быть генератором).
+        Документы загружаются в новый индекс {index_name}_<метка времени>, и алиас index_name
+        переключается на него одним атомарным запросом только после того, как поток
+        прочитан до конца. При ошибке чтения из БД или bulk-запроса новый индекс удаляется,
+        а поиск продолжает работать по старому индексу.
+        """
+        new_index = f"{self.index_name}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
         try:
-            if self.client.indices.exists(index=self.index_name):
-                self.client.indices.delete(index=self.index_name)
-                logger.info(f"Old index {self.index_name} deleted")
-            self.create_index()
-            success_count = 0
-            for ad in ads_data:
-                if self.index_ad(ad):
-                    success_count += 1
+            if not self.create_index(new_index):
+                return False
+            
+            prepare_failed = []
+            success, failed = bulk(
+                self.client,
+                self._bulk_actions(ads_data, prepare_failed),
+                index=new_index,
+                chunk_size=chunk_size,
+                raise_on_error=False
+            )
+            if failed:
+                logger.error(f"Bulk indexing failed for {len(failed)} documents: {failed}")
             
-            logger.info(f"Successfully reindexed {success_count} out of {len(ads_data)} ads")
-            return success_count == len(ads_data)
+            self._switch_alias(new_index)
+            
+            total_count = success + len(failed) + len(prepare_failed)
+            logger.info(f"Successfully reindexed {success} out of {total_count} ads into {new_index}")
+            return success == total_count
         except Exception as e:
-            logger.error(f"Error during reindexing all ads: {e}")
+            logger.error(f"Error during reindexing all ads, keeping the current index: {e}")
+            try:
+                self.client.indices.delete(index=new_index, ignore_unavailable=True)
+            except Exception as cleanup_error:
+                logger.error(f"Error deleting incomplete index {new_index}: {cleanup_error}")
             return False
 
+    def _switch_alias(self, new_index: str) -> None:
+        """Атомарно направляет алиас index_name на new_index и удаляет прежние индексы"""
+        actions = [{'add': {'index': new_index, 'alias': self.index_name}}]
+        old_indices = []
+        if self.client.indices.exists_alias(name=self.index_name):
+            old_indices = list(self.client.indices.get_alias(name=self.index_name))
+            actions = [{'remove': {'index': index, 'alias': self.index_name}} for index in old_indices] + actions
+        elif self.client.indices.exists(index=self.index_name):
+            # Индекс, созданный до перехода на алиас: удаляется в том же атомарном запросе
+            actions.insert(0, {'remove_index': {'index': self.index_name}})
+        self.client.indices.update_aliases(actions=actions)
+        logger.info(f"Alias {self.index_name} switched to {new_index}")
+        
+        # Алиас уже переключен: ошибка удаления старых индексов не должна откатывать переиндексацию
+        for index in old_indices:
+            try:
+                self.client.indices.delete(index=index, ignore_unavailable=True)
+                logger.info(f"Old index {index} deleted")
+            except Exception as e:
+                logger.error(f"Error deleting old index {index}: {e}")
+
+    def _bulk_actions(self, ads_data: Iterable[Dict], failed_ids: List):
+        """Действия для bulk; объявления, которые не удалось преобразовать, пропускаются"""
+        for ad in ads_data:
+            try:
+                yield {'_id': ad['id'], '_source': self._build_document(ad)}
+            except Exception as e:
+                logger.error(f"Error preparing ad {ad.get('id', 'N/A')} for indexing: {e}")
+                failed_ids.append(ad.get('id'))
+
     def search_ads(self, query: str = None, filters: Dict = None, sort_by: str = "relevance", sort_order: str = "desc", page: int = 1, size: int = 10) -> Dict:
         """Поиск объявлений с поддержкой сортировки и пагинации"""
         s = Search(using=self.client, index=self.index_name)
@@ -480,9 +534,13 @@ class ElasticsearchService:
             return {}
 
     def delete_index(self) -> bool:
-        """Удаление индекса"""
+        """Удаление индекса (или всех индексов за алиасом index_name)"""
         try:
-            if self.client.indices.exists(index=self.index_name):
+            if self.client.indices.exists_alias(name=self.index_name):
+                for index in list(self.client.indices.get_alias(name=self.index_name)):
+                    self.client.indices.delete(index=index)
+                    logger.info(f"Index {index} deleted successfully")
+            elif self.client.indices.exists(index=self.index_name):
                 self.client.indices.delete(index=self.index_name)
                 logger.info(f"Index {self.index_name} deleted successfully")
             return True
@@ -2,7 +2,7 @@ import asyncio
 import aiohttp
 import logging
 from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy import text
 from app.database.database import SessionLocal
 from app.database import db_models
@@ -209,8 +209,10 @@ class LinkValidationService:
     async def _delete_invalid_ads(self, db: Session, invalid_urls: List[str]) -> int:
         """Удаление объявлений с невалидными ссылками"""
         try:
-            # Находим объявления с невалидными ссылками
-            invalid_ads = db.query(db_models.DBAd).filter(
+            # Находим объявления с невалидными ссылками (для удаления достаточно id)
+            invalid_ads = db.query(db_models.DBAd).options(
+                load_only(db_models.DBAd.id)
+            ).filter(
                 db_models.DBAd.source_url.in_(invalid_urls)
             ).all()
             
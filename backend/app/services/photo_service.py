@@ -4,7 +4,8 @@ from PIL import Image
 import io
 import imagehash
 import logging
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.database import db_models
 import time
@@ -58,7 +59,11 @@ class PhotoService:
         # self.clip_model, self.clip_processor = get_clip_model_photo()  # Отключаем CLIP
         self.clip_model, self.clip_processor = None, None
     
-    async def process_ad_photos(self, db: Session, ad: db_models.DBAd):
+    def _client_session(self) -> aiohttp.ClientSession:
+        """HTTP-сессия для скачивания фото: пул соединений и keep-alive общие для всех запросов"""
+        return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+    
+    async def process_ad_photos(self, db: Session, ad: db_models.DBAd, session: Optional[aiohttp.ClientSession] = None):
         """Асинхронно и параллельно обрабатывает все фотографии объявления"""
         if not ad.photos:
             logger.info(f"No photos to process for ad {ad.id}")
@@ -73,11 +78,11 @@ class PhotoService:
             
         logger.info(f"Processing {len(photos_without_hash)} photos without hashes for ad {ad.id}")
         
-        tasks = []
-        for photo in photos_without_hash:
-            tasks.append(self._process_single_photo_with_retry(photo))
-            
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if session is None:
+            async with self._client_session() as session:
+                results = await self._download_photos(photos_without_hash, session)
+        else:
+            results = await self._download_photos(photos_without_hash, session)
         
         successful_hashes = 0
         failed_photos = 0
@@ -115,11 +120,15 @@ class PhotoService:
             logger.error(f"Error committing photo hashes for ad {ad.id}: {e}")
             db.rollback()
     
-    async def _process_single_photo_with_retry(self, photo: db_models.DBPhoto) -> Optional[Dict[str, str]]:
+    async def _download_photos(self, photos: List[db_models.DBPhoto], session: aiohttp.ClientSession) -> list:
+        tasks = [self._process_single_photo_with_retry(photo, session) for photo in photos]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _process_single_photo_with_retry(self, photo: db_models.DBPhoto, session: aiohttp.ClientSession) -> Optional[Dict[str, str]]:
         """Обрабатывает одну фотографию с повторными попытками"""
         for attempt in range(self.max_retries):
             try:
-                return await self._process_single_photo(photo)
+                return await self._process_single_photo(photo, session)
             except Exception as e:
                 error_msg = str(e)
                 
@@ -140,13 +149,11 @@ class PhotoService:
                     logger.error(f"All {self.max_retries} attempts failed for photo {photo.url}")
                     return None
     
-    async def _process_single_photo(self, photo: db_models.DBPhoto) -> Dict[str, str]:
+    async def _process_single_photo(self, photo: db_models.DBPhoto, session: aiohttp.ClientSession) -> Dict[str, str]:
         """Обрабатывает одну фотографию"""
         async with self.semaphore:
             start_time = time.time()
             try:
-                timeout = aiohttp.ClientTimeout(total=self.timeout)
-                
                 # Добавляем правильные заголовки для разных источников
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
@@ -158,23 +165,22 @@ class PhotoService:
                     headers['Accept'] = 'image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8'
                     headers['Accept-Language'] = 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
                 
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.get(photo.url, headers=headers) as response:
-                        if response.status == 200:
-                            content = await response.read()
-                            if not content or len(content) < 100:
-                                raise Exception("Image too small or empty")
-                            loop = asyncio.get_running_loop()
-                            photo_data = await loop.run_in_executor(
-                                None,
-                                self._compute_hash_sync,
-                                content
-                            )
-                            processing_time = time.time() - start_time
-                            logger.info(f"Computed hashes and embeddings for photo {photo.url} in {processing_time:.2f}s")
-                            return photo_data
-                        else:
-                            raise Exception(f"HTTP {response.status}: {response.reason}")
+                async with session.get(photo.url, headers=headers) as response:
+                    if response.status == 200:
+                        content = await response.read()
+                        if not content or len(content) < 100:
+                            raise Exception("Image too small or empty")
+                        loop = asyncio.get_running_loop()
+                        photo_data = await loop.run_in_executor(
+                            None,
+                            self._compute_hash_sync,
+                            content
+                        )
+                        processing_time = time.time() - start_time
+                        logger.info(f"Computed hashes and embeddings for photo {photo.url} in {processing_time:.2f}s")
+                        return photo_data
+                    else:
+                        raise Exception(f"HTTP {response.status}: {response.reason}")
             except Exception as e:
                 processing_time = time.time() - start_time
                 logger.error(f"Error processing photo {photo.url} after {processing_time:.2f}s: {e}")
@@ -212,48 +218,51 @@ class PhotoService:
     async def process_all_unprocessed_photos(self, db: Session, batch_size: int = 500):
         """Обрабатывает все фотографии без хешей в базе данных"""
         logger.info("Starting batch processing of all unprocessed photos...")
-        
+
         total_processed = 0
-        while True:
-            unprocessed_photos = db.query(db_models.DBPhoto).filter(
-                db_models.DBPhoto.perceptual_hashes.is_(None)
-            ).limit(batch_size).all()
-            
-            if not unprocessed_photos:
-                logger.info(f"Processing completed. Total processed: {total_processed}")
-                break
-            
-            logger.info(f"Processing batch of {len(unprocessed_photos)} photos...")
-            
-            photos_by_ad = {}
-            for photo in unprocessed_photos:
-                if photo.ad_id not in photos_by_ad:
-                    photos_by_ad[photo.ad_id] = []
-                photos_by_ad[photo.ad_id].append(photo)
-                
-            for ad_id, photos in photos_by_ad.items():
-                try:
-                    ad = db.query(db_models.DBAd).filter(db_models.DBAd.id == ad_id).first()
-                    if ad:
-                        await self.process_ad_photos(db, ad)
-                    else:
-                        logger.warning(f"Ad {ad_id} not found for photos")
-                except Exception as e:
-                    logger.error(f"Error processing photos for ad {ad_id}: {e}")
-            
-            total_processed += len(unprocessed_photos)
-            logger.info(f"Batch completed. Processed: {total_processed}")
-    
+        # Одна HTTP-сессия на весь прогон: соединения с хостами фото переиспользуются между объявлениями
+        async with self._client_session() as session:
+            while True:
+                unprocessed_photos = db.query(db_models.DBPhoto).filter(
+                    db_models.DBPhoto.perceptual_hashes.is_(None)
+                ).limit(batch_size).all()
+
+                if not unprocessed_photos:
+                    logger.info(f"Processing completed. Total processed: {total_processed}")
+                    break
+
+                logger.info(f"Processing batch of {len(unprocessed_photos)} photos...")
+
+                photos_by_ad = {}
+                for photo in unprocessed_photos:
+                    if photo.ad_id not in photos_by_ad:
+                        photos_by_ad[photo.ad_id] = []
+                    photos_by_ad[photo.ad_id].append(photo)
+
+                for ad_id, photos in photos_by_ad.items():
+                    try:
+                        ad = db.query(db_models.DBAd).filter(db_models.DBAd.id == ad_id).first()
+                        if ad:
+                            await self.process_ad_photos(db, ad, session)
+                        else:
+                            logger.warning(f"Ad {ad_id} not found for photos")
+                    except Exception as e:
+                        logger.error(f"Error processing photos for ad {ad_id}: {e}")
+
+                total_processed += len(unprocessed_photos)
+                logger.info(f"Batch completed. Processed: {total_processed}")
+
     async def get_processing_status(self) -> dict:
         """Получает статус обработки фотографий"""
         try:
             from app.database import SessionLocal
             db = SessionLocal()
             try:
-                total_photos = db.query(db_models.DBPhoto).count()
-                processed_photos = db.query(db_models.DBPhoto).filter(
-                    db_models.DBPhoto.perceptual_hashes.isnot(None)
-                ).count()
+                # Оба счетчика - одним проходом по таблице (COUNT по колонке пропускает NULL)
+                total_photos, processed_photos = db.query(
+                    func.count(db_models.DBPhoto.id),
+                    func.count(db_models.DBPhoto.perceptual_hashes)
+                ).one()
                 unprocessed_photos = total_photos - processed_photos
                 processing_percentage = (processed_photos / total_photos * 100) if total_photos > 0 else 0
                 
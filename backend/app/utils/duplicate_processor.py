@@ -1,14 +1,18 @@
 import logging
 import re
-from typing import List, Dict, Tuple, Optional
+import heapq
+import threading
+from itertools import islice
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, Iterable
 from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, or_, func, case
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import asyncio
 from app.database.db_models import DBAd, DBUniqueAd, DBAdDuplicate, DBUniquePhoto
-from app.services.ai_data_extractor import get_cached_gliner_model
+from app.services.ai_data_extractor import get_cached_gliner_model, get_inference_device
 
 # Импорты для CLIP модели
 try:
@@ -61,20 +65,46 @@ def get_text_model():
     if _text_model is None:
         logger.info("Loading improved SentenceTransformer model...")
         from sentence_transformers import SentenceTransformer
+        device = get_inference_device()
         try:
-            _text_model = SentenceTransformer("BAAI/bge-m3")
+            _text_model = SentenceTransformer("BAAI/bge-m3", device=device)
             logger.info("BGE-M3 model loaded successfully")
         except Exception as e:
             logger.warning(f"Failed to load BGE-M3 model: {e}")
             try:
-                _text_model = SentenceTransformer("BAAI/bge-large-zh-v1.5")
+                _text_model = SentenceTransformer("BAAI/bge-large-zh-v1.5", device=device)
                 logger.info("BGE-large-zh-v1.5 model loaded successfully")
             except Exception as e2:
                 logger.warning(f"Failed to load BGE-large-zh-v1.5 model: {e2}")
-                _text_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+                _text_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2", device=device)
                 logger.info("Fallback to paraphrase-multilingual-MiniLM-L12-v2 model")
     return _text_model
 
+# LRU-кэш эмбеддингов по тексту: одно и то же объявление часто публикуется на нескольких
+# сайтах (и повторно одним риэлтором) с идентичным текстом - модель для него не вызываем
+EMBEDDING_CACHE_SIZE = 4096
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()  # Обработка дубликатов идет и в пуле потоков
+
+def _cached_embedding(text: str) -> Optional[np.ndarray]:
+    with _embedding_cache_lock:
+        embedding = _embedding_cache.get(text)
+        if embedding is not None:
+            _embedding_cache.move_to_end(text)
+        return embedding
+
+def _cache_embedding(text: str, embedding: np.ndarray) -> np.ndarray:
+    # Копия отвязывает строку от матрицы батча; массив общий для всех вызовов -
+    # поэтому защищаем его от изменения на месте
+    embedding = np.array(embedding)
+    embedding.setflags(write=False)
+    with _embedding_cache_lock:
+        _embedding_cache[text] = embedding
+        _embedding_cache.move_to_end(text)
+        if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+    return embedding
+
 _gliner_model = None
 
 def get_gliner_model():
@@ -88,8 +118,6 @@ def get_gliner_model():
 class DuplicateProcessor:
     def __init__(self, db: Session, realtor_threshold: int = 5):
         self.db = db
-        self.text_model = get_text_model()
-        self.gliner_model = get_gliner_model()
         self.realtor_threshold = realtor_threshold
         
         # Инициализация CLIP модели (используем кэшированную)
@@ -99,6 +127,7 @@ class DuplicateProcessor:
         # Конфигурация для сбалансированной дедупликации с правильными весами
         self.config = {
             'semantic_top_k': 10,         # Кандидаты для анализа
+            'candidate_batch_size': 200,  # Размер порции при потоковом чтении кандидатов из БД
             'semantic_threshold': 0.7,    # Порог семантики
             'weights': {
                 'characteristics': 0.55,  # Основные характеристики (площадь, комнаты, этаж)
@@ -114,11 +143,26 @@ class DuplicateProcessor:
             'floor_tolerance_abs': 1,     # Допуск по этажу (±1 этаж)
             'photo_early_stop_threshold': 0.8,  # Порог для ранней остановки поиска совпадений
             'photo_required_threshold': 0.6,  # МИНИМАЛЬНЫЙ порог для обязательного совпадения фотографий
+            'early_exit_threshold': 0.9,  # Порог уверенного дубликата: остальные кандидаты не проверяются
+            'embedding_batch_size': 32,   # Размер минибатча энкодера при батчевом расчете эмбеддингов
         }
     
+    # Модели загружаются при первом обращении: статистика, риэлторы и карточки объявлений
+    # создают DuplicateProcessor, но эмбеддинги им не нужны
+    @property
+    def text_model(self):
+        return get_text_model()
+    
+    @property
+    def gliner_model(self):
+        return get_gliner_model()
+    
     def process_new_ads_batch(self, batch_size: int = 1000) -> int:
         """Обрабатывает батч необработанных объявлений"""
-        unprocessed_ads = self.db.query(DBAd).filter(
+        unprocessed_ads = self.db.query(DBAd).options(
+            selectinload(DBAd.photos),
+            selectinload(DBAd.location)
+        ).filter(
             and_(
                 DBAd.is_processed == False,
                 DBAd.is_duplicate == False
@@ -131,9 +175,25 @@ class DuplicateProcessor:
         if total_ads > 0:
             logger.info(f"Starting batch processing of {total_ads} ads")
         
+        # Характеристики и текстовые эмбеддинги не зависят от порядка обработки,
+        # поэтому считаем их заранее: модель кодирует весь батч за один проход.
+        # Ошибка на одном объявлении не должна ронять батч: для него передаем None,
+        # и process_ad повторит расчет внутри try ниже
+        characteristics_list = []
+        for ad in unprocessed_ads:
+            try:
+                characteristics_list.append(self._get_unified_characteristics(ad))
+            except Exception:
+                characteristics_list.append(None)
+        try:
+            embeddings_list = self._get_text_embeddings_batch(unprocessed_ads, characteristics_list)
+        except Exception as e:
+            logger.error(f"Error precomputing text embeddings for batch: {e}")
+            embeddings_list = [None] * total_ads
+        
         for i, ad in enumerate(unprocessed_ads):
             try:
-                self.process_ad(ad)
+                self.process_ad(ad, characteristics_list[i], embeddings_list[i])
                 processed_count += 1
                 if processed_count % 10 == 0 or processed_count == total_ads:
                     progress = int((processed_count / total_ads) * 100)
@@ -149,16 +209,23 @@ class DuplicateProcessor:
         
         return processed_count
     
-    def process_ad(self, ad: DBAd):
-        """Обрабатывает одно объявление"""
+    def process_ad(
+        self,
+        ad: DBAd,
+        ad_characteristics: Optional[Dict] = None,
+        text_embeddings: Optional[np.ndarray] = None
+    ):
+        """Обрабатывает одно объявление (характеристики и эмбеддинги можно передать предрассчитанными)"""
         logger.info(f"Processing ad {ad.id} ({ad.title})")
         
         # Шаг 1: Создаем унифицированный профиль для нового объявления
-        ad_characteristics = self._get_unified_characteristics(ad)
+        if ad_characteristics is None:
+            ad_characteristics = self._get_unified_characteristics(ad)
         
         ad_photo_hashes = [photo.perceptual_hashes for photo in ad.photos 
                           if photo.perceptual_hashes and isinstance(photo.perceptual_hashes, dict)]
-        text_embeddings = self._get_text_embeddings(ad, ad_characteristics)
+        if text_embeddings is None:
+            text_embeddings = self._get_text_embeddings(ad, ad_characteristics)
         
         # Шаг 2: Ищем похожие объявления
         similar_unique_ads = self._find_similar_unique_ads(ad, ad_characteristics, ad_photo_hashes, text_embeddings)
@@ -166,7 +233,7 @@ class DuplicateProcessor:
         if similar_unique_ads:
             unique_ad, similarity = similar_unique_ads[0]
             logger.info(f"Found duplicate with similarity {similarity:.2f}")
-            self._handle_duplicate(ad, unique_ad, similarity)
+            self._handle_duplicate(ad, unique_ad, similarity, ad_characteristics, text_embeddings)
         else:
             logger.info("Creating new unique ad")
             self._create_unique_ad(ad, ad_photo_hashes, text_embeddings)
@@ -216,6 +283,70 @@ class DuplicateProcessor:
             logger.warning("Text model not available, returning empty embedding")
             return np.array([])
             
+        full_text = self._build_embedding_text(ad, characteristics)
+        
+        if not full_text.strip():
+            logger.warning("Empty text for embedding, returning empty array")
+            return np.array([])
+            
+        embedding = _cached_embedding(full_text)
+        if embedding is not None:
+            return embedding
+        
+        try:
+            embedding = self.text_model.encode(full_text, normalize_embeddings=True)
+            return _cache_embedding(full_text, embedding)
+        except Exception as e:
+            logger.error(f"Error encoding text: {e}")
+            return np.array([])
+    
+    def _get_text_embeddings_batch(self, ads: List[DBAd], characteristics_list: List[Optional[Dict]]) -> List[Optional[np.ndarray]]:
+        """Создает эмбеддинги для списка объявлений одним батчевым вызовом модели."""
+        embeddings = [np.array([]) for _ in ads]
+        if self.text_model is None:
+            logger.warning("Text model not available, returning empty embeddings")
+            return embeddings
+        
+        # Для объявлений без характеристик (None) эмбеддинг посчитает process_ad
+        texts = [self._build_embedding_text(ad, chars) if chars is not None else None
+                 for ad, chars in zip(ads, characteristics_list)]
+        # В модель отправляем только уникальные тексты, которых еще нет в кэше
+        pending = {}
+        for i, text in enumerate(texts):
+            if text is None:
+                embeddings[i] = None
+                continue
+            if not text.strip():
+                continue
+            cached = _cached_embedding(text)
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                pending.setdefault(text, []).append(i)
+        if not pending:
+            return embeddings
+        
+        try:
+            # SentenceTransformer сам сортирует тексты по длине внутри вызова,
+            # поэтому паддинг идет только до самого длинного текста минибатча
+            encoded = self.text_model.encode(
+                list(pending),
+                batch_size=self.config['embedding_batch_size'],
+                normalize_embeddings=True
+            )
+        except Exception as e:
+            # Не роняем весь батч: process_ad посчитает эмбеддинги поштучно
+            logger.error(f"Error batch encoding texts: {e}")
+            return [None] * len(ads)
+        
+        for (text, text_indexes), embedding in zip(pending.items(), encoded):
+            embedding = _cache_embedding(text, embedding)
+            for i in text_indexes:
+                embeddings[i] = embedding
+        return embeddings
+    
+    def _build_embedding_text(self, ad: DBAd, characteristics: Dict) -> str:
+        """Собирает текст для эмбеддинга из заголовка, описания и характеристик."""
         text_parts = [
             ad.title.strip() if ad.title else "",
             ad.description.strip() if ad.description else ""
@@ -233,42 +364,53 @@ class DuplicateProcessor:
         # Фильтруем None значения и пустые строки
         filtered_parts = [part for part in text_parts if part is not None and part.strip()]
         full_text = ' '.join(filtered_parts)
-        full_text = ' '.join(full_text.split())
-        
-        if not full_text.strip():
-            logger.warning("Empty text for embedding, returning empty array")
-            return np.array([])
-            
-        try:
-            return self.text_model.encode(full_text)
-        except Exception as e:
-            logger.error(f"Error encoding text: {e}")
-            return np.array([])
+        return ' '.join(full_text.split())
     
     def _find_similar_unique_ads(
         self,
         ad: DBAd,
         ad_characteristics: Dict,
         ad_photo_hashes: List[Dict[str, str]],
-        text_embeddings: np.ndarray
+        text_embeddings: np.ndarray,
+        early_exit_threshold: Optional[float] = None
     ) -> List[Tuple[DBUniqueAd, float]]:
+        """
+        Возвращает подходящие уникальные объявления, отсортированные по убыванию схожести.
+        Если найден дубликат со схожестью выше early_exit_threshold (по умолчанию из конфига),
+        возвращается только он. Для отладки, чтобы увидеть все совпадения, передайте 1.0.
+        """
+        if early_exit_threshold is None:
+            early_exit_threshold = self.config['early_exit_threshold']
+        weights = self.config['weights']
         
-        # Шаг 1: Предварительная фильтрация по полям БД (быстрая)
+        # Шаг 1: Предварительная фильтрация по полям БД (быстрая,
+        # покрывается индексом ix_unique_ads_location_rooms_price)
         base_query = self.db.query(DBUniqueAd)
         if ad.location_id:
             base_query = base_query.filter(DBUniqueAd.location_id == ad.location_id)
-        # Убираем строгую фильтрацию по комнатам - сравниваем со всеми кандидатами
+        # Кандидаты с другим числом комнат все равно отсекаются в _check_critical_match,
+        # поэтому отсекаем их сразу в SQL (пустые комнаты оставляем - они извлекаются из текста)
+        ad_rooms = ad_characteristics.get('rooms')
+        if ad_rooms is not None:
+            base_query = base_query.filter(or_(
+                DBUniqueAd.rooms.is_(None),
+                DBUniqueAd.rooms == 0,
+                DBUniqueAd.rooms == ad_rooms
+            ))
         
-        candidate_ads = base_query.all()
-        logger.info(f"Found {len(candidate_ads)} candidates after initial DB filtering.")
-        if not candidate_ads:
-            return []
+        # Стримим кандидатов порциями, не материализуя всю выборку в памяти
+        candidate_ads = base_query.order_by(DBUniqueAd.id).yield_per(self.config['candidate_batch_size'])
 
         # Шаг 2: Семантический поиск для отбора лучших кандидатов
         semantic_candidates = self._find_semantic_candidates(
             candidate_ads, text_embeddings, top_k=self.config['semantic_top_k']
         )
         logger.info(f"Found {len(semantic_candidates)} semantic candidates.")
+        if not semantic_candidates:
+            return []
+        
+        # Подгружаем фото и локации отобранных кандидатов одним запросом вместо N ленивых
+        self._preload_candidate_relations([unique_ad for unique_ad, _ in semantic_candidates])
         
         # Шаг 3: Детальный анализ с гибридной проверкой
         similar_ads = []
@@ -286,6 +428,15 @@ class DuplicateProcessor:
                 ad_characteristics, unique_ad_characteristics
             )
             
+            # Дешевая предоценка: без нужной схожести характеристик кандидат не станет дубликатом
+            # даже при идеальных фото и тексте, поэтому хеши фотографий не сравниваем
+            max_remaining = sum(w for key, w in weights.items() if key != 'characteristics')
+            if (characteristics_sim < self.config['characteristics_similarity_threshold'] or
+                    characteristics_sim * weights['characteristics'] + max_remaining <= self.config['similarity_threshold']):
+                logger.info(f"❌ Низкая схожесть характеристик для ad {ad.id} vs unique {unique_ad.id}: "
+                            f"{characteristics_sim:.3f} - НЕ дубликат")
+                continue
+            
             # Получаем перцептивные хеши для unique_ad
             unique_ad_photo_hashes = [photo.perceptual_hashes for photo in unique_ad.photos if photo.perceptual_hashes]
             
@@ -303,13 +454,10 @@ class DuplicateProcessor:
             #         ad_clip_embeddings, unique_ad_clip_embeddings
             #     )
             
-            text_sim = self._calculate_text_similarity(
-                text_embeddings,
-                np.array(unique_ad.text_embeddings) if unique_ad.text_embeddings else np.array([])
-            )
+            # Текстовая схожесть уже посчитана на этапе семантического отбора
+            text_sim = semantic_sim
             address_sim = self._calculate_address_similarity_with_unique(ad, unique_ad)
             
-            weights = self.config['weights']
             overall_sim = (
                 characteristics_sim * weights['characteristics'] + 
                 perceptual_photo_sim * weights['perceptual_photos'] + 
@@ -338,6 +486,9 @@ class DuplicateProcessor:
                     overall_sim > self.config['similarity_threshold']):
                     similar_ads.append((unique_ad, overall_sim))
                     logger.info(f"✅ Найден дубликат с обязательным совпадением фото: {photo_sim_combined:.3f}")
+                    # Уверенное совпадение - остальных кандидатов не сравниваем
+                    if overall_sim > early_exit_threshold:
+                        return [(unique_ad, overall_sim)]
                 else:
                     logger.info(f"❌ Не прошли дополнительные проверки: characteristics={characteristics_sim:.3f}, "
                               f"photo_threshold={self.config['photo_similarity_threshold']}, overall={overall_sim:.3f}")
@@ -347,23 +498,74 @@ class DuplicateProcessor:
         
         return sorted(similar_ads, key=lambda x: x[1], reverse=True)
     
+    def _preload_candidate_relations(self, unique_ads: List[DBUniqueAd]):
+        """Пакетно загружает photos и location для кандидатов (без N+1 запросов)"""
+        if not unique_ads:
+            return
+        self.db.query(DBUniqueAd).options(
+            selectinload(DBUniqueAd.photos),
+            selectinload(DBUniqueAd.location)
+        ).filter(DBUniqueAd.id.in_([unique_ad.id for unique_ad in unique_ads])).all()
+    
     def _find_semantic_candidates(
         self,
-        candidate_ads: List[DBUniqueAd],
+        candidate_ads: Iterable[DBUniqueAd],
         text_embeddings: np.ndarray,
         top_k: int
     ) -> List[Tuple[DBUniqueAd, float]]:
-        """Находит топ-K семантически похожих кандидатов"""
+        """Находит топ-K семантически похожих кандидатов, обрабатывая их порциями"""
         semantic_scores = []
-        for unique_ad in candidate_ads:
-            if unique_ad.text_embeddings is not None and len(unique_ad.text_embeddings) > 0:
-                unique_text_embeddings = np.array(unique_ad.text_embeddings)
-                semantic_sim = self._calculate_text_similarity(text_embeddings, unique_text_embeddings)
-                if semantic_sim >= self.config['semantic_threshold']:
-                    semantic_scores.append((unique_ad, semantic_sim))
+        total_candidates = 0
+        candidates_iter = iter(candidate_ads)
+        while True:
+            chunk = list(islice(candidates_iter, self.config['candidate_batch_size']))
+            if not chunk:
+                break
+            total_candidates += len(chunk)
+            
+            with_embeddings = [
+                unique_ad for unique_ad in chunk
+                if unique_ad.text_embeddings is not None and len(unique_ad.text_embeddings) > 0
+            ]
+            similarities = self._batch_text_similarity(
+                text_embeddings, [unique_ad.text_embeddings for unique_ad in with_embeddings]
+            )
+            semantic_scores.extend(
+                (unique_ad, float(semantic_sim))
+                for unique_ad, semantic_sim in zip(with_embeddings, similarities)
+                if semantic_sim >= self.config['semantic_threshold']
+            )
+            # Держим в памяти только текущий топ-K
+            semantic_scores = heapq.nlargest(top_k, semantic_scores, key=lambda x: x[1])
+        
+        logger.info(f"Found {total_candidates} candidates after initial DB filtering.")
+        return semantic_scores
+
+    def _batch_text_similarity(self, query, embeddings: List) -> np.ndarray:
+        """Косинусная схожесть запроса со всеми эмбеддингами кандидатов одним матричным умножением"""
+        similarities = np.zeros(len(embeddings), dtype=np.float32)
+        if query is None or len(query) == 0 or not embeddings:
+            return similarities
+        
+        query = np.asarray(query, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return similarities
+        
+        # Эмбеддинги другой размерности (например, от резервной модели) считаем по одному
+        same_dim = [i for i, emb in enumerate(embeddings) if len(emb) == len(query)]
+        for i, emb in enumerate(embeddings):
+            if len(emb) != len(query):
+                similarities[i] = self._calculate_text_similarity(query, emb)
+        
+        if same_dim:
+            matrix = np.asarray([embeddings[i] for i in same_dim], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1)
+            dots = matrix @ query
+            with np.errstate(divide='ignore', invalid='ignore'):
+                similarities[same_dim] = np.where(norms > 0, dots / (norms * query_norm), 0.0)
         
-        semantic_scores.sort(key=lambda x: x[1], reverse=True)
-        return semantic_scores[:top_k]
+        return similarities
 
     def _check_critical_match(self, char1: Dict, char2: Dict) -> bool:
         """Проверяет совпадение критически важных характеристик из унифицированных профилей."""
@@ -442,61 +644,55 @@ class DuplicateProcessor:
 
         return True # Все критические проверки пройдены
     
+    @staticmethod
+    def _hash_matrices(hashes: List[Dict[str, str]], hash_type: str) -> Dict[int, np.ndarray]:
+        """Упаковывает hex-хеши одного типа в матрицы (N, L) uint8, сгруппированные по длине L"""
+        groups: Dict[int, List[bytes]] = {}
+        for hash_dict in hashes:
+            if not isinstance(hash_dict, dict):
+                continue
+            value = hash_dict.get(hash_type)
+            if value and isinstance(value, str):
+                groups.setdefault(len(value), []).append(value.encode('ascii', 'replace'))
+        return {
+            length: np.frombuffer(b''.join(values), dtype=np.uint8).reshape(len(values), length)
+            for length, values in groups.items()
+        }
+    
     def _calculate_photo_similarity(self, hashes1: List[Dict[str, str]], hashes2: List[Dict[str, str]]) -> float:
         """Вычисляет схожесть на основе перцептивных хешей - НОВАЯ ЛОГИКА: хотя бы одно совпадение"""
         if not hashes1 or not hashes2: 
             logger.debug("Пустые списки хешей для сравнения")
             return 0.0
         
-        # НОВАЯ ЛОГИКА: Ищем хотя бы одно совпадение среди всех фотографий
+        # Ищем лучшее совпадение среди всех пар фотографий сразу для всей матрицы пар
         best_similarity = 0.0
-        found_match = False
         
-        for hash_dict1 in hashes1:
-            for hash_dict2 in hashes2:
-                # Проверяем тип и валидность хешей
-                if not isinstance(hash_dict1, dict) or not isinstance(hash_dict2, dict):
-                    logger.debug(f"Пропускаем невалидные хеши: {type(hash_dict1)} vs {type(hash_dict2)}")
+        # Сравниваем только точные хеши (pHash и dHash более надежны)
+        for hash_type in ['pHash', 'dHash']:
+            matrices1 = self._hash_matrices(hashes1, hash_type)
+            matrices2 = self._hash_matrices(hashes2, hash_type)
+            
+            for length, matrix1 in matrices1.items():
+                matrix2 = matrices2.get(length)
+                if matrix2 is None:
                     continue
-                    
-                # Сравниваем только точные хеши (pHash и dHash более надежны)
-                for hash_type in ['pHash', 'dHash']:
-                    if hash_type in hash_dict1 and hash_type in hash_dict2:
-                        hash1 = hash_dict1[hash_type]
-                        hash2 = hash_dict2[hash_type]
-                        
-                        # Проверяем валидность хешей
-                        if hash1 and hash2 and isinstance(hash1, str) and isinstance(hash2, str):
-                            try:
-                                # Вычисляем расстояние Хэмминга
-                                distance = sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
-                                max_distance = len(hash1)
-                                similarity = 1.0 - (distance / max_distance)
-                                
-                                logger.info(f"🔍 {hash_type}: hash1={hash1[:8]}..., hash2={hash2[:8]}..., "
-                                          f"distance={distance}, similarity={similarity:.3f}")
-                                
-                                # НОВАЯ ЛОГИКА: Запоминаем лучшее совпадение
-                                if similarity > best_similarity:
-                                    best_similarity = similarity
-                                    found_match = True
-                                    logger.info(f"🎯 Новое лучшее совпадение {hash_type}: {similarity:.3f}")
-                                    
-                                # Если нашли очень хорошее совпадение, можно остановиться
-                                if similarity >= self.config['photo_early_stop_threshold']:
-                                    logger.info(f"🏆 Найдено отличное совпадение {hash_type}: {similarity:.3f}")
-                                    return similarity
-                                    
-                            except Exception as e:
-                                logger.warning(f"Ошибка вычисления расстояния Хэмминга для {hash_type}: {e}")
-                                continue
-                        else:
-                            logger.debug(f"Пропускаем невалидные хеши {hash_type}: {hash1} vs {hash2}")
+                
+                # Расстояние Хэмминга по символам для всех пар (N1, N2) одной операцией
+                distances = (matrix1[:, None, :] != matrix2[None, :, :]).sum(axis=2)
+                similarity = 1.0 - float(distances.min()) / length
+                
+                if similarity > best_similarity:
+                    best_similarity = similarity
+                    logger.info(f"🎯 Новое лучшее совпадение {hash_type}: {similarity:.3f}")
+            
+            # Если нашли очень хорошее совпадение, можно остановиться
+            if best_similarity >= self.config['photo_early_stop_threshold']:
+                logger.info(f"🏆 Найдено отличное совпадение {hash_type}: {best_similarity:.3f}")
+                return best_similarity
         
-        # Возвращаем лучшее найденное совпадение
-        result = best_similarity if found_match else 0.0
-        logger.info(f"📸 Схожесть фото: {result:.3f} (найдено совпадений: {found_match})")
-        return result
+        logger.info(f"📸 Схожесть фото: {best_similarity:.3f} (найдено совпадений: {best_similarity > 0})")
+        return best_similarity
     
     def _calculate_clip_embedding_similarity(self, embeddings1: List[np.ndarray], embeddings2: List[np.ndarray]) -> float:
         """
@@ -573,9 +769,11 @@ class DuplicateProcessor:
         if emb1.shape != emb2.shape:
             min_len = min(len(emb1), len(emb2))
             emb1, emb2 = emb1[:min_len], emb2[:min_len]
-        norm1, norm2 = np.linalg.norm(emb1), np.linalg.norm(emb2)
-        if norm1 == 0 or norm2 == 0: return 0.0
-        return float(np.dot(emb1, emb2) / (norm1 * norm2))
+        # Новые эмбеддинги уже нормированы, но в unique_ads могут лежать старые -
+        # поэтому делим на норму, но одним sqrt от произведения квадратов норм
+        norms_sq = np.vdot(emb1, emb1) * np.vdot(emb2, emb2)
+        if norms_sq == 0: return 0.0
+        return float(np.dot(emb1, emb2) / np.sqrt(norms_sq))
     
     def _calculate_contact_similarity(self, phones1: List[str], phones2: List[str]) -> float:
         if not phones1 or not phones2: return 0.0
@@ -698,7 +896,9 @@ class DuplicateProcessor:
         self,
         ad: DBAd,
         unique_ad: DBUniqueAd,
-        similarity: float
+        similarity: float,
+        ad_characteristics: Optional[Dict] = None,
+        text_embeddings: Optional[np.ndarray] = None
     ):
         """Обрабатывает найденный дубликат БЕЗ ОБНОВЛЕНИЯ УНИКАЛЬНОГО ОБЪЯВЛЕНИЯ"""
         ad_photo_hashes = [photo.perceptual_hashes for photo in ad.photos 
@@ -707,7 +907,8 @@ class DuplicateProcessor:
                                  if photo.perceptual_hashes and isinstance(photo.perceptual_hashes, dict)]
         
         # Получаем унифицированные характеристики для детального логирования
-        ad_characteristics = self._get_unified_characteristics(ad)
+        if ad_characteristics is None:
+            ad_characteristics = self._get_unified_characteristics(ad)
         unique_ad_characteristics = self._get_unified_characteristics(unique_ad)
 
         characteristics_sim = self._calculate_property_characteristics_similarity(
@@ -733,8 +934,11 @@ class DuplicateProcessor:
         # Общая схожесть фотографий (только перцептивные хеши)
         photo_sim_combined = perceptual_photo_sim
         
+        # Эмбеддинг объявления уже посчитан в process_ad - повторно модель не вызываем
+        if text_embeddings is None:
+            text_embeddings = self._get_text_embeddings(ad, ad_characteristics)
         text_sim = self._calculate_text_similarity(
-            self._get_text_embeddings(ad, ad_characteristics),
+            text_embeddings,
             np.array(unique_ad.text_embeddings) if unique_ad.text_embeddings else np.array([])
         )
         contact_sim = self._calculate_contact_similarity(ad.phone_numbers, unique_ad.phone_numbers)
@@ -841,17 +1045,33 @@ class DuplicateProcessor:
         
         return unique_ad
 
+    @staticmethod
+    def _ad_detail_options():
+        """Связи, которые читает transform_ad: грузим их пачкой, а не ленивым запросом на каждое объявление"""
+        return (
+            selectinload(DBAd.photos),
+            selectinload(DBAd.location),
+            selectinload(DBAd.realtor),
+            selectinload(DBAd.duplicate_info),
+        )
+
     def get_base_ad_for_unique(self, unique_ad_id: int) -> Optional[DBAd]:
         unique_ad = self.db.query(DBUniqueAd).filter(DBUniqueAd.id == unique_ad_id).first()
         if not unique_ad: return None
+        query = self.db.query(DBAd).options(*self._ad_detail_options())
         if hasattr(unique_ad, 'base_ad_id') and unique_ad.base_ad_id:
-            return self.db.query(DBAd).filter(DBAd.id == unique_ad.base_ad_id).first()
-        return self.db.query(DBAd).filter(DBAd.unique_ad_id == unique_ad.id, DBAd.is_duplicate == False).first()
+            return query.filter(DBAd.id == unique_ad.base_ad_id).first()
+        return query.filter(DBAd.unique_ad_id == unique_ad.id, DBAd.is_duplicate == False).first()
 
     def get_all_ads_for_unique(self, unique_ad_id: int) -> Dict[str, List[DBAd]]:
         base_ad = self.get_base_ad_for_unique(unique_ad_id)
-        duplicates = self.db.query(DBAdDuplicate).filter(DBAdDuplicate.unique_ad_id == unique_ad_id).all()
-        duplicate_ads = [self.db.query(DBAd).get(dup.original_ad_id) for dup in duplicates if self.db.query(DBAd).get(dup.original_ad_id)]
+        # Все объявления-дубликаты одним запросом через JOIN вместо двух get() на каждую запись
+        duplicate_ads = self.db.query(DBAd) \
+            .join(DBAdDuplicate, DBAdDuplicate.original_ad_id == DBAd.id) \
+            .options(*self._ad_detail_options()) \
+            .filter(DBAdDuplicate.unique_ad_id == unique_ad_id) \
+            .order_by(DBAdDuplicate.id) \
+            .all()
         return {
             'base_ad': [base_ad] if base_ad else [],
             'duplicates': duplicate_ads,
@@ -936,31 +1156,36 @@ class DuplicateProcessor:
             realtor.total_ads_count = total_ads_count
             realtor.updated_at = datetime.utcnow()
         
-        # 2. Находим и связываем уникальные объявления с риэлтором
-        unique_ads_to_update = (
-            self.db.query(DBUniqueAd)
-            .join(DBAd, DBAd.unique_ad_id == DBUniqueAd.id)
+        # 2. Связываем уникальные объявления с риэлтором одним UPDATE без загрузки объектов в сессию
+        # (уже связанные пропускаем, чтобы не переписывать строки при повторных запусках)
+        realtor_unique_ad_ids = (
+            self.db.query(DBAd.unique_ad_id)
             .filter(DBAd.phone_numbers.op("@>")(f'["{phone_number}"]'))
-            .distinct()
-            .all()
+            .filter(DBAd.unique_ad_id.isnot(None))
+        )
+        linked_count = (
+            self.db.query(DBUniqueAd)
+            .filter(DBUniqueAd.id.in_(realtor_unique_ad_ids))
+            .filter(DBUniqueAd.realtor_id.is_distinct_from(realtor.id))
+            .update({DBUniqueAd.realtor_id: realtor.id}, synchronize_session=False)
         )
-
-        for unique_ad in unique_ads_to_update:
-            unique_ad.realtor_id = realtor.id
         
-        logger.info(f"Linked {len(unique_ads_to_update)} unique ads to realtor: {phone_number}")
+        logger.info(f"Linked {linked_count} unique ads to realtor: {phone_number}")
 
     def get_duplicate_statistics(self) -> Dict[str, int]:
         """Возвращает статистику по дубликатам"""
-        total_unique_ads = self.db.query(DBUniqueAd).count()
-        total_original_ads = self.db.query(DBAd).count()
-        duplicate_ads = self.db.query(DBAd).filter(DBAd.is_duplicate == True).count()
-        base_ads = self.db.query(DBAd).filter(DBAd.is_duplicate == False).count()
-        unique_ads_with_duplicates = self.db.query(DBUniqueAd).filter(
-            DBUniqueAd.duplicates_count > 0
-        ).count()
-
-        avg_duplicates = self.db.query(func.avg(DBUniqueAd.duplicates_count)).scalar() or 0
+        # По одному проходу на таблицу: условные агрегаты вместо отдельных COUNT
+        total_original_ads, duplicate_ads, base_ads = self.db.query(
+            func.count(DBAd.id),
+            func.count(case((DBAd.is_duplicate == True, 1))),
+            func.count(case((DBAd.is_duplicate == False, 1)))
+        ).one()
+        total_unique_ads, unique_ads_with_duplicates, avg_duplicates = self.db.query(
+            func.count(DBUniqueAd.id),
+            func.count(case((DBUniqueAd.duplicates_count > 0, 1))),
+            func.avg(DBUniqueAd.duplicates_count)
+        ).one()
+        avg_duplicates = avg_duplicates or 0
         
         return {
             'total_unique_ads': total_unique_ads,
@@ -977,14 +1202,15 @@ class DuplicateProcessor:
         from app.database.db_models import DBRealtor
         
         total_realtors = self.db.query(DBRealtor).count()
-        realtor_unique_ads = self.db.query(DBUniqueAd).filter(
-            DBUniqueAd.realtor_id.isnot(None)
-        ).count()
-        realtor_original_ads = self.db.query(DBAd).filter(
-            DBAd.realtor_id.isnot(None)
-        ).count()
-        total_unique_ads = self.db.query(DBUniqueAd).count()
-        total_original_ads = self.db.query(DBAd).count()
+        # COUNT(column) считает только непустые realtor_id
+        total_unique_ads, realtor_unique_ads = self.db.query(
+            func.count(DBUniqueAd.id),
+            func.count(DBUniqueAd.realtor_id)
+        ).one()
+        total_original_ads, realtor_original_ads = self.db.query(
+            func.count(DBAd.id),
+            func.count(DBAd.realtor_id)
+        ).one()
         # Средний процент объявлений от риэлторов
         realtor_percentage = (realtor_unique_ads / total_unique_ads * 100) if total_unique_ads > 0 else 0
         return {
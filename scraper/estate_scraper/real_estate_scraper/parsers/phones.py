@@ -0,0 +1,16 @@
+import re
+
+# Все символы кроме цифр, +, пробелов, дефиса и скобок
+PHONE_JUNK_RE = re.compile(r'[^\d+\s\-\(\)]')
+
+
+def clean_phone_number(phone):
+    """Очищает номер телефона от лишних символов"""
+    # Убираем префикс tel: если есть
+    if phone.startswith('tel:'):
+        phone = phone[4:]
+
+    # Убираем все символы кроме цифр, + и пробелов, затем лишние пробелы
+    cleaned = ' '.join(PHONE_JUNK_RE.sub('', phone).split())
+
+    return cleaned if cleaned else None
@@ -2,11 +2,22 @@ import re
 import os
 from datetime import datetime
 from itemadapter import ItemAdapter
+from twisted.internet.defer import DeferredSemaphore, succeed
+from twisted.internet.threads import deferToThread
 import requests
 import sys
 import os
 from .logger import get_scraping_logger
 
+# Опциональный быстрый JSON-сериализатор для тела запроса к API
+try:
+    import orjson
+    ORJSON_ENABLED = True
+except ImportError:
+    ORJSON_ENABLED = False
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
 # Импорт валидатора фотографий
 try:
     from .services.photo_validator_service import PhotoValidatorService
@@ -40,36 +51,48 @@ if os.path.exists(backend_path):
 
 sys.path.append(project_root)
 
-# Импортируем AI сервис с обработкой ошибок
-try:
-    # Импортируем новый модульный AI extractor
-    from backend.app.services.ai_data_extractor import AIDataExtractor
-    ai_extractor = AIDataExtractor()
-    AI_ENABLED = True
-    print(f"✅ AI Data Extractor loaded successfully with modular architecture!")
-except ImportError as e:
-    print(f"⚠️ AI Data Extractor not available: {e}")
-    AI_ENABLED = False
-    ai_extractor = None
-    # Дополнительная отладка
-    ai_module_path = os.path.join(project_root, 'backend', 'app', 'services', 'ai_data_extractor.py')
-    print(f"🔍 Expected AI module path: {ai_module_path}")
-    print(f"🔍 AI module exists: {os.path.exists(ai_module_path)}")
-    
-    # Дополнительная диагностика структуры папок
-    print(f"🔍 Contents of project_root ({project_root}): {os.listdir(project_root) if os.path.exists(project_root) else 'N/A'}")
-    backend_path = os.path.join(project_root, 'backend')
-    if os.path.exists(backend_path):
-        print(f"🔍 Contents of backend folder: {os.listdir(backend_path)}")
-        app_path = os.path.join(backend_path, 'app')
-        if os.path.exists(app_path):
-            print(f"🔍 Contents of app folder: {os.listdir(app_path)}")
-            services_path = os.path.join(app_path, 'services')
-            if os.path.exists(services_path):
-                print(f"🔍 Contents of services folder: {os.listdir(services_path)}")
-    
-    import traceback
-    print(f"🔍 Full traceback: {traceback.format_exc()}")
+# AI сервис загружается лениво (в open_spider DatabasePipeline): импорт модуля тянет
+# sentence_transformers/sklearn, а создание экстрактора - загрузку моделей,
+# и платить за это при простом импорте пайплайнов не нужно
+AI_ENABLED = False
+ai_extractor = None
+
+
+def _load_ai_extractor():
+    """Импортирует и создает AI экстрактор; выполняется один раз в пуле потоков реактора"""
+    global AI_ENABLED, ai_extractor
+    if ai_extractor is not None:
+        return ai_extractor
+    try:
+        # Импортируем новый модульный AI extractor
+        from backend.app.services.ai_data_extractor import get_cached_ai_extractor
+        ai_extractor = get_cached_ai_extractor()
+        AI_ENABLED = True
+        print(f"✅ AI Data Extractor loaded successfully with modular architecture!")
+    except ImportError as e:
+        print(f"⚠️ AI Data Extractor not available: {e}")
+        AI_ENABLED = False
+        ai_extractor = None
+        # Дополнительная отладка
+        ai_module_path = os.path.join(project_root, 'backend', 'app', 'services', 'ai_data_extractor.py')
+        print(f"🔍 Expected AI module path: {ai_module_path}")
+        print(f"🔍 AI module exists: {os.path.exists(ai_module_path)}")
+
+        # Дополнительная диагностика структуры папок
+        print(f"🔍 Contents of project_root ({project_root}): {os.listdir(project_root) if os.path.exists(project_root) else 'N/A'}")
+        backend_path = os.path.join(project_root, 'backend')
+        if os.path.exists(backend_path):
+            print(f"🔍 Contents of backend folder: {os.listdir(backend_path)}")
+            app_path = os.path.join(backend_path, 'app')
+            if os.path.exists(app_path):
+                print(f"🔍 Contents of app folder: {os.listdir(app_path)}")
+                services_path = os.path.join(app_path, 'services')
+                if os.path.exists(services_path):
+                    print(f"🔍 Contents of services folder: {os.listdir(services_path)}")
+
+        import traceback
+        print(f"🔍 Full traceback: {traceback.format_exc()}")
+    return ai_extractor
 
 
 class ParserPipeline:
@@ -331,6 +354,13 @@ class DatabasePipeline:
             # '/ads/', '/promo/', '/watermark/'
         ]
 
+    def open_spider(self, spider):
+        # Ограничение одновременных AI-извлечений (см. AI_EXTRACTION_CONCURRENCY в settings)
+        self.ai_semaphore = DeferredSemaphore(spider.settings.getint('AI_EXTRACTION_CONCURRENCY', 1))
+        # Загрузка AI моделей не блокирует реактор; Scrapy дождется Deferred
+        # перед обработкой первого объявления
+        return deferToThread(_load_ai_extractor)
+
     def filter_photos(self, images):
         """
         Фильтрует список ссылок на фото по паттернам из self.photo_filter_patterns
@@ -602,66 +632,83 @@ class DatabasePipeline:
         spider.logger.info(f"🔍 AI Debug: AI_ENABLED={AI_ENABLED}, ai_extractor={ai_extractor is not None if ai_extractor else 'None'}")
         
         if AI_ENABLED and ai_extractor:
-            try:
-                ai_title = adapter.get("title") or ""
-                description = adapter.get("description") or ""
-                
-                spider.logger.info(f"🤖 Starting AI processing for title: {ai_title[:50]}...")
-                spider.logger.debug(f"🤖 Description: {description[:100]}...")
-                
-                # Подготавливаем item_data с данными из конфигов (если есть)
-                item_data = payload.copy()  # Начинаем с парсенных данных
-                
-                # Добавляем точную классификацию из конфигов спайдера (если доступна)
-                if hasattr(spider, 'config') and spider.config:
-                    # Для мультикатегорийных спайдеров данные могут быть в item
-                    config_data = {}
-                    
-                    # Проверяем есть ли данные классификации в самом item
-                    if adapter.get('property_type'):
-                        config_data['property_type'] = adapter.get('property_type')
-                    if adapter.get('listing_type'):
-                        config_data['listing_type'] = adapter.get('listing_type')
-                    if adapter.get('source'):
-                        config_data['source'] = adapter.get('source')
-                    if adapter.get('category_name'):
-                        config_data['category_name'] = adapter.get('category_name')
-                    if adapter.get('category_id'):
-                        config_data['category_id'] = adapter.get('category_id')
-                    
-                    if config_data:
-                        item_data.update(config_data)
-                        spider.logger.info(f"🎯 Используем точную классификацию из конфига: {config_data}")
-                
-                # Применяем AI для извлечения недостающих данных и классификации
-                enhanced_data = ai_extractor.extract_and_classify(
-                    title=ai_title,
-                    description=description, 
-                    existing_data=item_data  # Передаем данные с классификацией из конфигов
-                )
-                
-                # Логируем AI обработку
-                scraping_logger.log_ai_processing(ai_title, description, enhanced_data)
-                
-                spider.logger.debug(f"🤖 AI extracted data: {enhanced_data}")
-                
-                # Обновляем payload с данными от AI
-                payload.update(enhanced_data)
-                spider.logger.info(f"✅ AI enhancement completed for: {ai_title[:50]}... | Updated payload keys: {list(enhanced_data.keys())}")
+            ai_title = adapter.get("title") or ""
+            description = adapter.get("description") or ""
+            
+            spider.logger.info(f"🤖 Starting AI processing for title: {ai_title[:50]}...")
+            spider.logger.debug("🤖 Description: %.100s...", description)
+            
+            # Подготавливаем item_data с данными из конфигов (если есть)
+            item_data = payload.copy()  # Начинаем с парсенных данных
+            
+            # Добавляем точную классификацию из конфигов спайдера (если доступна)
+            if hasattr(spider, 'config') and spider.config:
+                # Для мультикатегорийных спайдеров данные могут быть в item
+                config_data = {}
                 
-                # 🔍 ДИАГНОСТИКА: Логируем после AI обработки
-                spider.logger.info(f"🔍 DIAGNOSTIC: После AI - payload property_type = {payload.get('property_type')}")
-                spider.logger.info(f"🔍 DIAGNOSTIC: После AI - payload listing_type = {payload.get('listing_type')}")
+                # Проверяем есть ли данные классификации в самом item
+                if adapter.get('property_type'):
+                    config_data['property_type'] = adapter.get('property_type')
+                if adapter.get('listing_type'):
+                    config_data['listing_type'] = adapter.get('listing_type')
+                if adapter.get('source'):
+                    config_data['source'] = adapter.get('source')
+                if adapter.get('category_name'):
+                    config_data['category_name'] = adapter.get('category_name')
+                if adapter.get('category_id'):
+                    config_data['category_id'] = adapter.get('category_id')
                 
-            except Exception as e:
-                spider.logger.error(f"❌ AI enhancement failed: {e}")
-                scraping_logger.log_error(f"AI enhancement failed", f"Title: {title}", e)
-                import traceback
-                spider.logger.error(f"❌ AI traceback: {traceback.format_exc()}")
+                if config_data:
+                    item_data.update(config_data)
+                    spider.logger.info(f"🎯 Используем точную классификацию из конфига: {config_data}")
+            
+            # Применяем AI для извлечения недостающих данных и классификации.
+            # Извлечение тяжелое (модели), поэтому выполняется в пуле потоков реактора,
+            # не блокируя реактор; число одновременных извлечений ограничено семафором.
+            # Логирование и изменение payload остаются в потоке реактора (колбэки)
+            d = self.ai_semaphore.run(
+                deferToThread,
+                ai_extractor.extract_and_classify,
+                title=ai_title,
+                description=description,
+                existing_data=item_data  # Передаем данные с классификацией из конфигов
+            )
+            d.addCallback(self._apply_ai_result, payload, ai_title, description, spider, scraping_logger)
+            # Ошибка извлечения или применения результата не мешает отправке объявления
+            d.addErrback(self._log_ai_failure, title, spider, scraping_logger)
         else:
             spider.logger.warning(f"⚠️ AI enhancement skipped - AI_ENABLED={AI_ENABLED}, ai_extractor available={ai_extractor is not None if ai_extractor else 'None'}")
             scraping_logger.log_warning("AI enhancement skipped", f"AI_ENABLED={AI_ENABLED}, ai_extractor available={ai_extractor is not None}")
-
+            d = succeed(None)
+        
+        d.addCallback(lambda _: self._send_payload(payload, title, spider, scraping_logger))
+        d.addCallback(lambda _: item)
+        return d
+    
+    def _apply_ai_result(self, enhanced_data, payload, ai_title, description, spider, scraping_logger):
+        """Добавляет в payload данные, извлеченные AI"""
+        # Логируем AI обработку
+        scraping_logger.log_ai_processing(ai_title, description, enhanced_data)
+        
+        # Ленивое форматирование: repr всего словаря строится, только если включен DEBUG
+        spider.logger.debug("🤖 AI extracted data: %s", enhanced_data)
+        
+        # Обновляем payload с данными от AI
+        payload.update(enhanced_data)
+        spider.logger.info(f"✅ AI enhancement completed for: {ai_title[:50]}... | Updated payload keys: {list(enhanced_data.keys())}")
+        
+        # 🔍 ДИАГНОСТИКА: Логируем после AI обработки
+        spider.logger.info(f"🔍 DIAGNOSTIC: После AI - payload property_type = {payload.get('property_type')}")
+        spider.logger.info(f"🔍 DIAGNOSTIC: После AI - payload listing_type = {payload.get('listing_type')}")
+    
+    def _log_ai_failure(self, failure, title, spider, scraping_logger):
+        """Логирует ошибку AI; объявление отправляется без AI-данных"""
+        spider.logger.error(f"❌ AI enhancement failed: {failure.value}")
+        scraping_logger.log_error(f"AI enhancement failed", f"Title: {title}", failure.value)
+        spider.logger.error(f"❌ AI traceback: {failure.getTraceback()}")
+    
+    def _send_payload(self, payload, title, spider, scraping_logger):
+        """Отправляет объявление в API (сетевой вызов - в пуле потоков)"""
         # 🔍 Логирование финального payload перед отправкой
         spider.logger.info(f"🔍 Final payload being sent to API:")
         spider.logger.info(f"  📝 Title: {payload.get('title', 'N/A')}")
@@ -674,32 +721,50 @@ class DatabasePipeline:
         spider.logger.info(f"  👤 Realtor: {payload.get('realtor_id')}")
         spider.logger.info(f"  📞 Phones: {payload.get('phone_numbers')}")
         
-        try:
-            response = requests.post(self.API_URL, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            # Определяем тип операции по статус коду
-            if response.status_code == 200:
-                spider.logger.info(f"✅ Ad processed successfully (created or updated): {payload.get('title')}")
-                scraping_logger.log_api_call_success(title, self.API_URL)
-                scraping_logger.log_item_success(title, payload)
-            else:
-                spider.logger.info(f"✅ Ad sent to API with status {response.status_code}: {payload.get('title')}")
-                scraping_logger.log_api_call_success(title, self.API_URL)
-                scraping_logger.log_item_success(title, payload)
-                
-        except requests.exceptions.HTTPError as e:
+        d = deferToThread(self._post_payload, payload)
+        d.addCallbacks(
+            self._log_post_success, self._log_post_failure,
+            callbackArgs=(payload, title, spider, scraping_logger),
+            errbackArgs=(payload, title, spider, scraping_logger)
+        )
+        return d
+    
+    def _post_payload(self, payload):
+        if ORJSON_ENABLED:
+            try:
+                body = orjson.dumps(payload)
+            except TypeError:
+                # Нестандартные значения (например, нестроковые ключи) - через stdlib json
+                body = None
+            if body is not None:
+                response = requests.post(self.API_URL, data=body, headers=JSON_HEADERS, timeout=30)
+                response.raise_for_status()
+                return response
+        response = requests.post(self.API_URL, json=payload, timeout=30)
+        response.raise_for_status()
+        return response
+    
+    def _log_post_success(self, response, payload, title, spider, scraping_logger):
+        # Определяем тип операции по статус коду
+        if response.status_code == 200:
+            spider.logger.info(f"✅ Ad processed successfully (created or updated): {payload.get('title')}")
+        else:
+            spider.logger.info(f"✅ Ad sent to API with status {response.status_code}: {payload.get('title')}")
+        scraping_logger.log_api_call_success(title, self.API_URL)
+        scraping_logger.log_item_success(title, payload)
+    
+    def _log_post_failure(self, failure, payload, title, spider, scraping_logger):
+        e = failure.value
+        if isinstance(e, requests.exceptions.HTTPError):
             error_text = ""
             try:
-                error_text = response.text
+                error_text = e.response.text
             except Exception:
                 pass
             error_msg = f"HTTP Error {e}: {error_text}"
             spider.logger.error(f"Error sending ad to API: {e} | Data: {payload} | Response: {error_text}")
             scraping_logger.log_api_call_failure(title, error_msg, self.API_URL)
-        except Exception as e:
+        else:
             spider.logger.error(f"Error sending ad to API: {e} | Data: {payload}")
             scraping_logger.log_api_call_failure(title, str(e), self.API_URL)
-        
-        return item
 
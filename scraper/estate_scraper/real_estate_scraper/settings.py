@@ -73,6 +73,15 @@ ITEM_PIPELINES = {
     'real_estate_scraper.pipelines.DatabasePipeline': 300,       # Потом отправляем в API
 }
 
+# Пул потоков реактора: в нем DatabasePipeline выполняет AI-извлечение и отправку в API,
+# не блокируя реактор
+REACTOR_THREADPOOL_MAXSIZE = int(os.getenv("SCRAPY_THREADPOOL_SIZE", "8"))
+
+# Сколько AI-извлечений выполняется одновременно. Все они используют одни и те же модели
+# GLiNER/E5, а каждый проход torch и так занимает несколько потоков CPU, поэтому
+# по умолчанию - одно извлечение за раз
+AI_EXTRACTION_CONCURRENCY = int(os.getenv("SCRAPY_AI_CONCURRENCY", "1"))
+
 
 
 
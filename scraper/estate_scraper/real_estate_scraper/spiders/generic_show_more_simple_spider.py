@@ -2,6 +2,7 @@ import scrapy
 import random
 from scrapy_playwright.page import PageMethod
 from ..parsers.loader import load_config
+from ..parsers.phones import clean_phone_number
 from ..logger import get_scraping_logger
 import logging
 import os
@@ -519,18 +520,7 @@ class GenericShowMoreSimpleSpider(scrapy.Spider):
     def _clean_phone_number(self, phone):
         """Очищает номер телефона от лишних символов"""
         try:
-            # Убираем префикс tel: если есть
-            if phone.startswith('tel:'):
-                phone = phone[4:]
-            
-            # Убираем все символы кроме цифр, + и пробелов
-            import re
-            cleaned = re.sub(r'[^\d+\s\-\(\)]', '', phone)
-            
-            # Убираем лишние пробелы
-            cleaned = ' '.join(cleaned.split())
-            
-            return cleaned if cleaned else None
+            return clean_phone_number(phone)
         except Exception as e:
             self.logger.warning(f"Error cleaning phone number '{phone}': {e}")
             return phone
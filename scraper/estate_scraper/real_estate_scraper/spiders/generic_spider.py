@@ -1,6 +1,7 @@
 import scrapy
 from scrapy_playwright.page import PageMethod
 from ..parsers.loader import load_config, extract_value
+from ..parsers.phones import clean_phone_number
 import time
 import random
 import os
@@ -610,18 +611,7 @@ class GenericSpider(scrapy.Spider):
     def _clean_phone_number(self, phone):
         """Очищает номер телефона от лишних символов"""
         try:
-            # Убираем префикс tel: если есть
-            if phone.startswith('tel:'):
-                phone = phone[4:]
-            
-            # Убираем все символы кроме цифр, + и пробелов
-            import re
-            cleaned = re.sub(r'[^\d+\s\-\(\)]', '', phone)
-            
-            # Убираем лишние пробелы
-            cleaned = ' '.join(cleaned.split())
-            
-            return cleaned if cleaned else None
+            return clean_phone_number(phone)
         except Exception as e:
             self.logger.warning(f"Error cleaning phone number '{phone}': {e}")
             return phone
@@ -52,6 +52,11 @@ SUCCESS_PATTERNS = [
     r"finish_reason.*finished"    # Добавляем проверку причины завершения
 ]
 
+# Каждый набор паттернов - одно скомпилированное регулярное выражение: строка лога
+# проверяется одним проходом вместо отдельного re.search на каждый паттерн
+PARSING_ERROR_RE = re.compile("|".join(f"(?:{pattern})" for pattern in PARSING_ERROR_PATTERNS), re.IGNORECASE)
+SUCCESS_RE = re.compile("|".join(f"(?:{pattern})" for pattern in SUCCESS_PATTERNS), re.IGNORECASE)
+
 
 def update_status(job_id, **kwargs):
     job = r.hget(JOBS_KEY, job_id)
@@ -75,17 +80,11 @@ def check_job_status(job_id):
 
 def detect_parsing_errors(log_line):
     """Определяет наличие ошибок парсинга в логе"""
-    for pattern in PARSING_ERROR_PATTERNS:
-        if re.search(pattern, log_line, re.IGNORECASE):
-            return True
-    return False
+    return PARSING_ERROR_RE.search(log_line) is not None
 
 def detect_success_signals(log_line):
     """Определяет наличие сигналов успешного завершения"""
-    for pattern in SUCCESS_PATTERNS:
-        if re.search(pattern, log_line, re.IGNORECASE):
-            return True
-    return False
+    return SUCCESS_RE.search(log_line) is not None
 
 def monitor_process_with_stop_check(proc, job_id):
     """Мониторинг процесса с проверкой остановки и ошибок парсинга"""
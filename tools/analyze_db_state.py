@@ -32,10 +32,28 @@ def analyze_database_state():
         
         # 1. Общая статистика
         print("\n📊 ОБЩАЯ СТАТИСТИКА:")
-        total_ads = db.query(func.count(db_models.DBAd.id)).scalar()
+        # Все счетчики по DBAd - одним проходом по таблице (COUNT игнорирует NULL из case без else
+        # и из самой колонки, поэтому фильтр isnot(None) не нужен)
+        (total_ads, total_duplicates, total_base_ads, unprocessed_ads,
+         error_ads, ads_with_unique, orphan_ads) = db.query(
+            func.count(db_models.DBAd.id),
+            func.count(case((db_models.DBAd.is_duplicate == True, 1))),
+            func.count(case((db_models.DBAd.is_duplicate == False, 1))),
+            func.count(case((db_models.DBAd.is_processed == False, 1))),
+            func.count(case((or_(
+                db_models.DBAd.title.is_(None),
+                db_models.DBAd.title == '',
+                db_models.DBAd.price.is_(None),
+                db_models.DBAd.price == 0
+            ), 1))),
+            func.count(db_models.DBAd.unique_ad_id),
+            func.count(case((and_(
+                db_models.DBAd.unique_ad_id.is_(None),
+                db_models.DBAd.is_duplicate == False
+            ), 1)))
+        ).one()
+        ads_without_unique = total_ads - ads_with_unique
         total_unique_ads = db.query(func.count(db_models.DBUniqueAd.id)).scalar()
-        total_duplicates = db.query(func.count(db_models.DBAd.id)).filter(db_models.DBAd.is_duplicate == True).scalar()
-        total_base_ads = db.query(func.count(db_models.DBAd.id)).filter(db_models.DBAd.is_duplicate == False).scalar()
         
         print(f"Всего объявлений в DBAd: {total_ads}")
         print(f"Уникальных объявлений в DBUniqueAd: {total_unique_ads}")
@@ -44,9 +62,6 @@ def analyze_database_state():
         
         # 2. Анализ необработанных объявлений
         print("\n🔍 АНАЛИЗ НЕОБРАБОТАННЫХ ОБЪЯВЛЕНИЙ:")
-        unprocessed_ads = db.query(func.count(db_models.DBAd.id)).filter(
-            db_models.DBAd.is_processed == False
-        ).scalar()
         print(f"Необработанных объявлений: {unprocessed_ads}")
         
         # 3. Анализ по источникам
@@ -78,24 +93,10 @@ def analyze_database_state():
         
         # 5. Анализ ошибок парсинга
         print("\n❌ АНАЛИЗ ОШИБОК:")
-        error_ads = db.query(func.count(db_models.DBAd.id)).filter(
-            or_(
-                db_models.DBAd.title.is_(None),
-                db_models.DBAd.title == '',
-                db_models.DBAd.price.is_(None),
-                db_models.DBAd.price == 0
-            )
-        ).scalar()
         print(f"Объявлений с ошибками (пустые title/price): {error_ads}")
         
         # 6. Анализ связей с уникальными объявлениями
         print("\n🔗 АНАЛИЗ СВЯЗЕЙ:")
-        ads_with_unique = db.query(func.count(db_models.DBAd.id)).filter(
-            db_models.DBAd.unique_ad_id.isnot(None)
-        ).scalar()
-        ads_without_unique = db.query(func.count(db_models.DBAd.id)).filter(
-            db_models.DBAd.unique_ad_id.is_(None)
-        ).scalar()
         print(f"Объявлений связанных с уникальными: {ads_with_unique}")
         print(f"Объявлений НЕ связанных с уникальными: {ads_without_unique}")
         
@@ -103,25 +104,16 @@ def analyze_database_state():
         print("\n🔍 ДЕТАЛЬНЫЙ АНАЛИЗ 'ИСЧЕЗНУВШИХ' ОБЪЯВЛЕНИЙ:")
         
         # Объявления без уникальных связей и не дубликаты
-        orphan_ads = db.query(func.count(db_models.DBAd.id)).filter(
-            and_(
-                db_models.DBAd.unique_ad_id.is_(None),
-                db_models.DBAd.is_duplicate == False
-            )
-        ).scalar()
         print(f"Осиротевших объявлений (не дубликаты, без связи): {orphan_ads}")
         
         # Необработанные объявления
-        unprocessed_count = db.query(func.count(db_models.DBAd.id)).filter(
-            db_models.DBAd.is_processed == False
-        ).scalar()
-        print(f"Необработанных объявлений: {unprocessed_count}")
+        print(f"Необработанных объявлений: {unprocessed_ads}")
         
         # 8. Рекомендации
         print("\n💡 РЕКОМЕНДАЦИИ:")
         
-        if unprocessed_count > 0:
-            print(f"  ⚠️  Есть {unprocessed_count} необработанных объявлений")
+        if unprocessed_ads > 0:
+            print(f"  ⚠️  Есть {unprocessed_ads} необработанных объявлений")
             print("     Запустите обработку дубликатов для их обработки")
         
         if orphan_ads > 0:
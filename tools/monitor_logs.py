@@ -4,12 +4,20 @@
 """
 
 import os
+import re
+import sys
 import time
+import json
+import atexit
 import argparse
-import glob
+import threading
 from datetime import datetime
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+if sys.platform.startswith('linux'):
+    # На Linux явно используем inotify, чтобы не скатиться в опрос на некоторых ФС
+    from watchdog.observers.inotify import InotifyObserver as Observer
+else:
+    from watchdog.observers import Observer
 
 # Цветовая схема для терминала
 class Colors:
@@ -24,15 +32,78 @@ class Colors:
     UNDERLINE = '\033[4m'
     ENDC = '\033[0m'  # Сброс цвета
 
+def _keywords_re(keywords):
+    """Компилирует набор ключевых слов в одно регулярное выражение"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+ERROR_KEYWORDS = ['ERROR', 'CRITICAL', '❌', '🚫', '💥']
+ERROR_RE = _keywords_re(ERROR_KEYWORDS)
+# Тот же фильтр по сырым байтам: строки отбрасываются до декодирования UTF-8
+ERROR_KEYWORDS_BYTES = [keyword.encode('utf-8') for keyword in ERROR_KEYWORDS]
+
+
+def _error_lines(buf):
+    """
+    Строки буфера, содержащие ключевые слова ошибок (как splitlines() + фильтр, но без
+    обхода каждой строки в Python): каждое слово ищется bytes.find по всему буферу,
+    и из буфера вырезаются только строки вокруг найденных вхождений
+    """
+    line_ends = {}
+    for keyword in ERROR_KEYWORDS_BYTES:
+        i = buf.find(keyword)
+        while i != -1:
+            start = max(buf.rfind(b'\n', 0, i), buf.rfind(b'\r', 0, i)) + 1
+            end = line_ends.get(start)
+            if end is None:
+                end = buf.find(b'\n', i)
+                if end == -1:
+                    end = len(buf)
+                cr = buf.find(b'\r', i, end)
+                if cr != -1:
+                    end = cr
+                line_ends[start] = end
+            # Остальные вхождения в этой строке не нужны
+            i = buf.find(keyword, end)
+    return [buf[start:line_ends[start]] for start in sorted(line_ends)]
+
+
+# Сколько строк копить перед принудительной записью в stdout
+OUTPUT_BATCH_SIZE = 32
+
+# Сохраненные позиции чтения: после перезапуска уже показанные строки не перечитываются
+STATE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'monitor_logs', 'positions.json')
+# Период сохранения позиций в режиме слежения (секунды)
+STATE_SAVE_INTERVAL = 10
+
+# Уровни сообщений в порядке приоритета: (шаблон, готовая строка "метка + цвет")
+LEVEL_PATTERNS = [
+    (ERROR_RE, f" 🚨 {Colors.RED}"),
+    (_keywords_re(['WARNING', '⚠️']), f" ⚠️ {Colors.YELLOW}"),
+    (_keywords_re(['SUCCESS', '✅', '🎉']), f" ✅ {Colors.GREEN}"),
+    (_keywords_re(['INFO', '🚀', '📊', '📋']), f" ℹ️ {Colors.CYAN}"),
+    (_keywords_re(['DEBUG', '🔍']), f" 🔍 {Colors.PURPLE}"),
+]
+DEFAULT_LEVEL = f" 📝 {Colors.WHITE}"
+
 class LogMonitor(FileSystemEventHandler):
     """Мониторинг логов парсинга"""
     
-    def __init__(self, log_dir="logs/scraping", follow_new=True, show_errors_only=False):
+    def __init__(self, log_dir="logs/scraping", follow_new=True, show_errors_only=False, from_start=False):
         self.log_dir = log_dir
         self.follow_new = follow_new
         self.show_errors_only = show_errors_only
+        self.from_start = from_start
+        self._state = {}  # Позиции с прошлого запуска: {абсолютный путь: {"inode", "pos"}}
+        self._save_timer = None
+        self._save_lock = threading.Lock()  # Сохранение вызывается и из таймера, и из основного потока/atexit
+        self._stopping = False
         self.watched_files = {}
         self.last_positions = {}
+        self._handles = {}  # Открытые дескрипторы отслеживаемых файлов
+        self._out_buf = []  # Буфер отформатированных строк для пакетного вывода
+        self._file_tags = {}  # Предсобранные цветные метки файлов
+        self._ts_cache_sec = -1  # Секунда, для которой отформатирована метка времени
+        self._ts_cache_str = ""
         
         print(f"{Colors.CYAN}📡 Запуск мониторинга логов в: {log_dir}{Colors.ENDC}")
         print(f"{Colors.YELLOW}⚙️ Режим: {'только ошибки' if show_errors_only else 'все логи'}{Colors.ENDC}")
@@ -40,27 +111,120 @@ class LogMonitor(FileSystemEventHandler):
     
     def start_monitoring(self):
         """Запуск мониторинга"""
+        if not self.from_start:
+            self._state = self._load_state()
+        atexit.register(self._save_state)
+        
         # Проверяем существующие логи
         self.check_existing_logs()
         
         if self.follow_new:
-            # Следим за новыми файлами
+            # Однократно дочитываем уже существующие логи, дальше работают события
+            self.check_file_updates()
+            
+            # Следим за новыми файлами и изменениями: чтение идет только по событиям on_modified
             observer = Observer()
             observer.schedule(self, self.log_dir, recursive=True)
             observer.start()
+            self._schedule_state_save()
             
             try:
                 print(f"{Colors.GREEN}✅ Мониторинг запущен. Нажмите Ctrl+C для остановки{Colors.ENDC}")
-                while True:
-                    time.sleep(1)
-                    self.check_file_updates()
+                while observer.is_alive():
+                    observer.join(timeout=60)
             except KeyboardInterrupt:
+                self.flush_output()
                 print(f"\n{Colors.YELLOW}🛑 Остановка мониторинга...{Colors.ENDC}")
                 observer.stop()
             observer.join()
         else:
             # Однократная проверка
             self.check_file_updates()
+        
+        # Останавливаем периодическое сохранение до финального
+        self._stopping = True
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_state()
+        self.close_handles()
+    
+    def _load_state(self):
+        """Загружает сохраненные позиции чтения"""
+        try:
+            with open(STATE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"{Colors.YELLOW}⚠️ Не удалось прочитать сохраненные позиции {STATE_PATH}: {e}{Colors.ENDC}")
+            return {}
+    
+    def _save_state(self):
+        """Сохраняет текущие позиции чтения (атомарно через временный файл)"""
+        with self._save_lock:
+            # Позиции с прошлых запусков переносим, только если файл все еще тот же:
+            # удаленные и ротированные логи выпадают, и файл состояния не растет бесконечно
+            state = {}
+            for path, saved in self._state.items():
+                try:
+                    if os.stat(path).st_ino == saved.get("inode"):
+                        state[path] = saved
+                except OSError:
+                    continue
+            for filepath, pos in list(self.last_positions.items()):
+                try:
+                    inode = os.stat(filepath).st_ino
+                except OSError:
+                    continue
+                state[os.path.abspath(filepath)] = {"inode": inode, "pos": pos}
+            
+            try:
+                os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+                tmp_path = STATE_PATH + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, STATE_PATH)
+            except OSError as e:
+                print(f"{Colors.YELLOW}⚠️ Не удалось сохранить позиции в {STATE_PATH}: {e}{Colors.ENDC}")
+    
+    def _schedule_state_save(self):
+        """Периодически сохраняет позиции, чтобы они пережили аварийное завершение"""
+        self._save_timer = threading.Timer(STATE_SAVE_INTERVAL, self._periodic_state_save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+    
+    def _periodic_state_save(self):
+        self._save_state()
+        if not self._stopping:
+            self._schedule_state_save()
+    
+    def _initial_position(self, filepath, stat_result):
+        """Позиция, с которой начинать чтение файла: сохраненная, если файл тот же"""
+        saved = self._state.get(os.path.abspath(filepath))
+        if saved and saved.get("inode") == stat_result.st_ino and saved.get("pos", 0) <= stat_result.st_size:
+            return saved["pos"]
+        # Новый, ротированный или усеченный файл - читаем с начала
+        return 0
+    
+    def close_handles(self):
+        """Закрывает открытые файлы логов"""
+        for f in self._handles.values():
+            f.close()
+        self._handles.clear()
+    
+    def _get_handle(self, filepath, stat_result):
+        """Возвращает постоянный дескриптор файла, переоткрывая его при ротации лога"""
+        f = self._handles.get(filepath)
+        if f is not None and os.fstat(f.fileno()).st_ino != stat_result.st_ino:
+            # Файл был заменен (ротация) - читаем новый с начала
+            f.close()
+            f = None
+            self.last_positions[filepath] = 0
+        
+        if f is None:
+            f = open(filepath, 'rb', buffering=0)
+            self._handles[filepath] = f
+        return f
     
     def check_existing_logs(self):
         """Проверка существующих логов"""
@@ -69,21 +233,24 @@ class LogMonitor(FileSystemEventHandler):
             print(f"{Colors.YELLOW}💡 Возможно, парсинг еще не запускался или нужно запустить Docker контейнеры{Colors.ENDC}")
             return
         
-        log_files = glob.glob(f"{self.log_dir}/*.log")
-        if not log_files:
+        # Один проход по каталогу: DirEntry кэширует stat, отдельные getsize/getmtime не нужны
+        with os.scandir(self.log_dir) as it:
+            entries = [entry for entry in it if entry.name.endswith('.log') and entry.is_file()]
+        entries.sort(key=lambda entry: entry.name)
+        
+        if not entries:
             print(f"{Colors.YELLOW}⚠️ Файлы логов не найдены в {self.log_dir}{Colors.ENDC}")
             print(f"{Colors.CYAN}💡 Логи появятся после запуска задач парсинга{Colors.ENDC}")
         else:
-            print(f"{Colors.GREEN}📁 Найдено файлов логов: {len(log_files)}{Colors.ENDC}")
-            for log_file in sorted(log_files):
-                filename = os.path.basename(log_file)
-                size = os.path.getsize(log_file)
-                mtime = datetime.fromtimestamp(os.path.getmtime(log_file))
-                print(f"   📄 {filename} ({size} байт, изменен: {mtime.strftime('%H:%M:%S')})")
+            print(f"{Colors.GREEN}📁 Найдено файлов логов: {len(entries)}{Colors.ENDC}")
+            for entry in entries:
+                stat_result = entry.stat()
+                mtime = datetime.fromtimestamp(stat_result.st_mtime)
+                print(f"   📄 {entry.name} ({stat_result.st_size} байт, изменен: {mtime.strftime('%H:%M:%S')})")
                 
                 # Добавляем в отслеживаемые
-                self.watched_files[log_file] = True
-                self.last_positions[log_file] = 0
+                self.watched_files[entry.path] = True
+                self.last_positions[entry.path] = self._initial_position(entry.path, stat_result)
     
     def check_file_updates(self):
         """Проверка обновлений в файлах"""
@@ -94,56 +261,68 @@ class LogMonitor(FileSystemEventHandler):
     def read_new_lines(self, filepath):
         """Читает новые строки из файла"""
         try:
-            current_size = os.path.getsize(filepath)
+            stat_result = os.stat(filepath)
+            f = self._get_handle(filepath, stat_result)
+            current_size = stat_result.st_size
             last_pos = self.last_positions.get(filepath, 0)
             
+            if current_size < last_pos:
+                # Файл был усечен - начинаем заново
+                last_pos = 0
+            
             if current_size > last_pos:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    f.seek(last_pos)
-                    new_lines = f.readlines()
-                    
-                    for line in new_lines:
-                        line = line.strip()
-                        if line:
-                            self.format_and_print_line(line, filepath)
-                    
-                    self.last_positions[filepath] = f.tell()
+                # Одно позиционное чтение сырых байт без seek и текстовой обертки
+                buf = os.pread(f.fileno(), current_size - last_pos, last_pos)
+                self.last_positions[filepath] = last_pos + len(buf)
+                
+                raw_lines = _error_lines(buf) if self.show_errors_only else buf.splitlines()
+                
+                for raw in raw_lines:
+                    line = raw.decode('utf-8', 'replace').strip()
+                    if line:
+                        self.format_and_print_line(line, filepath)
                     
         except Exception as e:
             print(f"{Colors.RED}❌ Ошибка чтения файла {filepath}: {e}{Colors.ENDC}")
+        finally:
+            self.flush_output()
     
     def format_and_print_line(self, line, filepath):
         """Форматирует и выводит строку лога"""
-        filename = os.path.basename(filepath)
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        # Фильтрация по уровню если нужно (до любой работы по форматированию)
+        if self.show_errors_only and not ERROR_RE.search(line):
+            return
         
-        # Фильтрация по уровню если нужно
-        if self.show_errors_only:
-            if not any(level in line for level in ['ERROR', 'CRITICAL', '❌', '🚫', '💥']):
-                return
+        # strftime пересчитываем только при смене секунды
+        sec = int(time.time())
+        if sec != self._ts_cache_sec:
+            self._ts_cache_sec = sec
+            self._ts_cache_str = time.strftime("%H:%M:%S", time.localtime(sec))
+        timestamp = self._ts_cache_str
         
-        # Цветовое кодирование по типу сообщения
-        color = Colors.WHITE
-        prefix = "📝"
+        # Цветовое кодирование по типу сообщения: первый совпавший уровень по приоритету
+        level = DEFAULT_LEVEL
+        for pattern, level_str in LEVEL_PATTERNS:
+            if pattern.search(line):
+                level = level_str
+                break
         
-        if any(keyword in line for keyword in ['ERROR', 'CRITICAL', '❌', '🚫', '💥']):
-            color = Colors.RED
-            prefix = "🚨"
-        elif any(keyword in line for keyword in ['WARNING', '⚠️']):
-            color = Colors.YELLOW
-            prefix = "⚠️"
-        elif any(keyword in line for keyword in ['SUCCESS', '✅', '🎉']):
-            color = Colors.GREEN
-            prefix = "✅"
-        elif any(keyword in line for keyword in ['INFO', '🚀', '📊', '📋']):
-            color = Colors.CYAN
-            prefix = "ℹ️"
-        elif any(keyword in line for keyword in ['DEBUG', '🔍']):
-            color = Colors.PURPLE
-            prefix = "🔍"
+        # Метка файла постоянна для файла - собираем ее один раз
+        file_tag = self._file_tags.get(filepath)
+        if file_tag is None:
+            file_tag = self._file_tags[filepath] = f"{Colors.ENDC} {Colors.BOLD}[{os.path.basename(filepath)}]{Colors.ENDC}"
         
-        # Выводим с цветом и меткой файла
-        print(f"{Colors.BLUE}[{timestamp}]{Colors.ENDC} {Colors.BOLD}[{filename}]{Colors.ENDC} {prefix} {color}{line}{Colors.ENDC}")
+        # Выводим с цветом и меткой файла (через буфер, см. flush_output)
+        self._out_buf.append(Colors.BLUE + "[" + timestamp + "]" + file_tag + level + line + Colors.ENDC)
+        if len(self._out_buf) >= OUTPUT_BATCH_SIZE:
+            self.flush_output()
+    
+    def flush_output(self):
+        """Выводит накопленные строки одной записью в stdout"""
+        if self._out_buf:
+            sys.stdout.write("\n".join(self._out_buf) + "\n")
+            sys.stdout.flush()
+            self._out_buf.clear()
     
     def on_created(self, event):
         """Обработка создания новых файлов"""
@@ -180,6 +359,11 @@ def main():
         action="store_true", 
         help="Не следить за новыми файлами (одноразовая проверка)"
     )
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="Игнорировать сохраненные позиции и читать логи с начала"
+    )
     
     args = parser.parse_args()
     
@@ -189,7 +373,8 @@ def main():
     monitor = LogMonitor(
         log_dir=args.dir,
         follow_new=not args.no_follow,
-        show_errors_only=args.errors_only
+        show_errors_only=args.errors_only,
+        from_start=args.from_start
     )
     
     monitor.start_monitoring()